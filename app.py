@@ -3,16 +3,28 @@
 Extended Flask Admin Server with ComfyUI + Telegram Integration
 """
 
-from flask import Flask, render_template, jsonify, request, send_file, make_response
+from flask import Flask, Response, render_template, jsonify, request, send_file, make_response
+from flask.json.provider import JSONProvider
 import subprocess
 import psutil
 import os
+import re
 import socket
-import json
-import uuid
+import orjson
+import atexit
+import datetime
+import functools
+import http.client
+import ipaddress
+import mimetypes
+import threading
+import time
 import requests
+from dataclasses import dataclass, field
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 from typing import Optional
+from urllib.parse import quote
 
 # Job system imports
 from jobs.models import Job, JobStatus
@@ -29,19 +41,34 @@ from telegram.api import TelegramAPI
 from telegram.webhook import telegram_bp, init_webhook
 from telegram.poller import TelegramPoller
 
+# Caching helpers
+from cache import ttl_cache
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # ===== Configuration =====
 
+# KEY=value lines; comments and blank lines never match
+_ENV_LINE_RE = re.compile(r'^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t]*$', re.MULTILINE)
+
+def parse_env_file(path: Path) -> dict:
+    """Parse a KEY=value env file into an ordered dict."""
+    return dict(_ENV_LINE_RE.findall(path.read_text()))
+
 # Load telegram config from file if it exists
 _telegram_config_file = Path('./telegram_config.env')
 if _telegram_config_file.exists():
-    with open(_telegram_config_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                os.environ[key.strip()] = value.strip()
+    os.environ.update(parse_env_file(_telegram_config_file))
 
 def get_env(key: str, default: str = "") -> str:
     """Get environment variable."""
@@ -57,6 +84,7 @@ COMFYUI_BASE_URL = get_env("COMFYUI_BASE_URL", "http://127.0.0.1:8188")
 STORAGE_ROOT = Path(get_env("STORAGE_ROOT", "./data"))
 PUBLIC_BASE_URL = get_env("PUBLIC_BASE_URL", "")
 WORKFLOW_PATH = Path(get_env("WORKFLOW_PATH", "./Workflows/image_to_video_base.json"))
+SONG_WORKFLOW_PATH = Path(get_env("SONG_WORKFLOW_PATH", "/home/karol/ComfyUI/user/default/workflows/song-api.json"))
 
 # Docket config
 DOCKET_API_PORT = get_env("DOCKET_API_PORT", "3050")
@@ -68,32 +96,138 @@ DOCKET_WEB_URL = f"http://127.0.0.1:{DOCKET_WEB_PORT}"
 TELEGRAM_BOT_TOKEN = get_env("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_BOT_NAME = get_env("TELEGRAM_BOT_NAME", "")
 TELEGRAM_DEFAULT_CHAT_ID = get_env("TELEGRAM_DEFAULT_CHAT_ID", "")
+# Secret for webhook delivery; with an https PUBLIC_BASE_URL, Telegram pushes
+# updates to /telegram/webhook instead of the poller long-polling for them
+TELEGRAM_WEBHOOK_SECRET = get_env("TELEGRAM_WEBHOOK_SECRET", "")
+
+# Result file offload to a fronting web server (optional)
+# USE_X_SENDFILE: emit X-Sendfile (Apache mod_xsendfile, lighttpd, Caddy)
+# X_ACCEL_REDIRECT_PREFIX: internal nginx location mapped to STORAGE_ROOT, e.g. /_internal/jobs
+USE_X_SENDFILE = get_env_bool("USE_X_SENDFILE", False)
+X_ACCEL_REDIRECT_PREFIX = get_env("X_ACCEL_REDIRECT_PREFIX", "").rstrip('/')
 
 # Runtime config file
 CONFIG_FILE = Path("./config.json")
 
+# Maximum queued jobs; beyond this new jobs are refused with 503
+JOB_QUEUE_MAXSIZE = int(get_env("JOB_QUEUE_MAXSIZE", "128"))
+QUEUE_FULL_RETRY_AFTER = 5
+
+# Jobs processed at once. ComfyUI still runs prompts one at a time, but extra
+# workers stage inputs and fetch outputs while another job is executing.
+JOB_WORKERS = max(1, int(get_env("JOB_WORKERS", "1")))
+
+# How long service/container status checks are reused across requests (seconds)
+STATUS_CACHE_TTL = 2.0
+
+# Services and containers reported on the dashboard
+MONITORED_SERVICES = ("ollama", "comfyui", "sunshine")
+MONITORED_CONTAINERS = ("open-webui", "docket-converter")
+
+# Docker Engine API socket (container status is read from it directly)
+DOCKER_SOCKET = get_env("DOCKER_SOCKET", "/var/run/docker.sock")
+
+# Request validation
+ALLOWED_SERVICES = frozenset({'ollama', 'comfyui', 'sunshine'})
+ALLOWED_CONTAINERS = frozenset({'open-webui', 'docket-converter'})
+ALLOWED_ACTIONS = frozenset({'start', 'stop', 'restart'})
+URL_SCHEME_RE = re.compile(r'^(?:https?|telegram)://')
+
+# Networks allowed to reach the dashboard
+LOCAL_NETWORKS = (
+    ipaddress.ip_network('192.168.0.0/16'),
+    ipaddress.ip_network('127.0.0.0/8'),
+)
+
+# Browser cache lifetime for completed job outputs, in seconds
+RESULT_CACHE_MAX_AGE = 86400
+
+# Timestamp format shown on the config page
+MTIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 # ===== Runtime Config =====
 
 class RuntimeConfig:
-    """Runtime configuration with persistence."""
+    """Runtime configuration with persistence.
+
+    Changes are applied in memory immediately and written to disk by a
+    background thread SAVE_DELAY after the first one, so a burst of toggles
+    results in a single write. A failed write is retried.
+    """
+
+    # How long the writer waits for more changes before saving, in seconds
+    SAVE_DELAY = 0.5
+
+    # How long the writer waits before retrying a failed save, in seconds
+    RETRY_DELAY = 5.0
 
     def __init__(self, config_file: Path):
         self.config_file = config_file
         self.data = self._load()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = threading.Event()
+        # Bumped on every change, so a flush only clears _dirty if nothing
+        # changed while it was writing
+        self._version = 0
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
 
     def _load(self) -> dict:
         """Load config from file."""
         if self.config_file.exists():
-            with open(self.config_file, 'r') as f:
-                return json.load(f)
+            with open(self.config_file, 'rb') as f:
+                return orjson.loads(f.read())
         return {
             "telegram_enabled": get_env_bool("TELEGRAM_ENABLED", False)
         }
 
-    def _save(self):
-        """Save config to file."""
-        with open(self.config_file, 'w') as f:
-            json.dump(self.data, f, indent=2)
+    def _save(self) -> int:
+        """Save config to file atomically (write temp file, fsync, rename).
+
+        Returns:
+            Version of the config that was written
+        """
+        with self._lock:
+            payload = orjson.dumps(self.data, option=orjson.OPT_INDENT_2)
+            version = self._version
+
+        tmp_path = self.config_file.with_name(self.config_file.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.config_file)
+        return version
+
+    def _writer_loop(self):
+        """Persist pending changes in the background."""
+        while True:
+            self._dirty.wait()
+            # Let the rest of a burst of changes land first
+            time.sleep(self.SAVE_DELAY)
+            if not self.flush():
+                time.sleep(self.RETRY_DELAY)
+
+    def flush(self) -> bool:
+        """Write pending changes to disk now.
+
+        Returns:
+            False if the write failed (the changes stay pending)
+        """
+        with self._flush_lock:
+            if not self._dirty.is_set():
+                return True
+            try:
+                version = self._save()
+            except OSError as e:
+                print(f"[RuntimeConfig] Failed to save config: {e}", flush=True)
+                return False
+            with self._lock:
+                if self._version == version:
+                    self._dirty.clear()
+            return True
 
     def get_telegram_enabled(self) -> bool:
         """Get Telegram enabled status."""
@@ -101,79 +235,255 @@ class RuntimeConfig:
 
     def set_telegram_enabled(self, enabled: bool):
         """Set Telegram enabled status."""
-        self.data["telegram_enabled"] = enabled
-        self._save()
+        with self._lock:
+            self.data["telegram_enabled"] = enabled
+            self._version += 1
+        self._dirty.set()
 
 runtime_config = RuntimeConfig(CONFIG_FILE)
 
+# Let send_file hand result files to the fronting server
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+
 # ===== Initialize Components =====
 
 # Job system
-job_queue = JobQueue()
+job_queue = JobQueue(num_shards=JOB_WORKERS, maxsize=JOB_QUEUE_MAXSIZE)
 job_store = JobStore(str(STORAGE_ROOT))
-comfy_client = ComfyUIClient(COMFYUI_BASE_URL)
-
-# Telegram (if configured)
-telegram_api: Optional[TelegramAPI] = None
-if TELEGRAM_BOT_TOKEN:
-    telegram_api = TelegramAPI(TELEGRAM_BOT_TOKEN)
 
-# Worker (started later)
-job_worker: Optional[JobWorker] = None
-
-# Telegram poller (started later)
-telegram_poller: Optional[TelegramPoller] = None
+# Docket proxy (pooled keep-alive connections to the local Docket containers)
+docket_session = requests.Session()
+docket_session.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=32))
+
+
+@dataclass
+class AppState:
+    """Settings and components that can be replaced while the app is running.
+
+    The config routes swap these out at runtime, so they live on one shared
+    object instead of module globals. Writers hold ``lock``; readers that use
+    a component more than once should copy it to a local first.
+    """
+    comfyui_base_url: str
+    comfy_client: ComfyUIClient
+    telegram_bot_token: str = ""
+    telegram_bot_name: str = ""
+    telegram_default_chat_id: str = ""
+    public_base_url: str = ""
+    telegram_api: Optional[TelegramAPI] = None
+    telegram_poller: Optional[TelegramPoller] = None
+    job_worker: Optional[JobWorker] = None
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+
+STATE = AppState(
+    comfyui_base_url=COMFYUI_BASE_URL,
+    comfy_client=ComfyUIClient(COMFYUI_BASE_URL),
+    telegram_bot_token=TELEGRAM_BOT_TOKEN,
+    telegram_bot_name=TELEGRAM_BOT_NAME,
+    telegram_default_chat_id=TELEGRAM_DEFAULT_CHAT_ID,
+    public_base_url=PUBLIC_BASE_URL,
+    telegram_api=TelegramAPI(TELEGRAM_BOT_TOKEN) if TELEGRAM_BOT_TOKEN else None,
+)
+
+# GPU stats via NVML (optional, falls back to nvidia-smi)
+try:
+    import pynvml
+    pynvml.nvmlInit()
+    _nvml_handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+except Exception:
+    _nvml_handle = None
 
 # ===== Helper Functions =====
 
+@functools.lru_cache(maxsize=256)
 def is_local_network(ip):
-    """Check if IP is from local network."""
-    return ip.startswith('192.168.') or ip == '127.0.0.1' or ip == 'localhost'
+    """Check if IP is from local network.
 
-def run_command(cmd):
-    """Run a system command and return output."""
+    Runs on every request, so results are cached per address; dashboard
+    clients are a handful of IPs.
+    """
+    if ip == 'localhost':
+        return True
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    # Unwrap IPv4-mapped IPv6 (::ffff:192.168.x.y) from dual-stack sockets
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return any(addr in net for net in LOCAL_NETWORKS)
+
+def run_command(argv):
+    """Run a system command and return output.
+
+    Args:
+        argv: Command and arguments as a list (no shell is involved)
+
+    Returns:
+        Dict with success flag, stdout and stderr
+    """
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=10)
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=10)
         return {"success": True, "output": result.stdout, "error": result.stderr}
     except subprocess.TimeoutExpired:
         return {"success": False, "error": "Command timed out"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def get_service_status(service):
-    """Get systemd service status."""
-    result = subprocess.run(f"systemctl is-active {service}", shell=True, capture_output=True, text=True)
-    return result.stdout.strip()
+@ttl_cache(ttl=STATUS_CACHE_TTL)
+def get_service_statuses(services):
+    """Get systemd status for several services with one systemctl call (cached briefly).
 
-def get_docker_status(container):
-    """Get Docker container status."""
-    result = subprocess.run(f"docker inspect -f '{{{{.State.Running}}}}' {container} 2>/dev/null",
-                          shell=True, capture_output=True, text=True)
-    return "running" if result.stdout.strip() == "true" else "stopped"
+    Args:
+        services: Tuple of service names
 
-def get_system_stats():
-    """Get system statistics."""
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
+    Returns:
+        Dict mapping service name to its `systemctl is-active` state
+    """
+    try:
+        result = subprocess.run(["systemctl", "is-active", *services],
+                                capture_output=True, text=True)
+    except OSError:
+        return {service: "" for service in services}
+
+    states = result.stdout.split()
+    return {service: states[i] if i < len(states) else "" for i, service in enumerate(services)}
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix domain socket (for the Docker Engine API)."""
+
+    def __init__(self, socket_path, timeout=2):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
 
-    # Get GPU stats
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def _docker_api_statuses(containers):
+    """Ask the Docker Engine API which of the given containers are running.
+
+    Args:
+        containers: Tuple of container names
+
+    Returns:
+        Dict mapping container name to "running" or "stopped"
+
+    Raises:
+        OSError, http.client.HTTPException, ValueError: If the API is unusable
+    """
+    filters = quote(orjson.dumps({"name": list(containers)}).decode())
+    conn = _UnixHTTPConnection(DOCKER_SOCKET)
+    try:
+        conn.request('GET', f'/containers/json?all=1&filters={filters}')
+        resp = conn.getresponse()
+        body = resp.read()
+        if resp.status != 200:
+            raise ValueError(f"Docker API returned {resp.status}")
+    finally:
+        conn.close()
+
+    statuses = {container: "stopped" for container in containers}
+    # The name filter matches substrings, so compare exact names
+    for info in orjson.loads(body):
+        for name in info.get('Names', ()):
+            name = name.lstrip('/')
+            if name in statuses and info.get('State') == 'running':
+                statuses[name] = "running"
+    return statuses
+
+@ttl_cache(ttl=STATUS_CACHE_TTL)
+def get_docker_statuses(containers):
+    """Get Docker status for several containers (cached briefly).
+
+    Reads the Docker Engine socket directly; falls back to one docker
+    inspect call when the socket isn't accessible.
+
+    Args:
+        containers: Tuple of container names
+
+    Returns:
+        Dict mapping container name to "running" or "stopped"
+    """
+    try:
+        return _docker_api_statuses(containers)
+    except (OSError, http.client.HTTPException, ValueError):
+        pass
+
+    statuses = {container: "stopped" for container in containers}
+    try:
+        result = subprocess.run(["docker", "inspect", "-f", "{{.Name}} {{.State.Running}}", *containers],
+                                capture_output=True, text=True)
+    except OSError:
+        return statuses
+
+    # One "/<name> <running>" line per container that exists
+    for line in result.stdout.splitlines():
+        name, _, running = line.strip().lstrip('/').partition(' ')
+        if name in statuses and running == "true":
+            statuses[name] = "running"
+    return statuses
+
+# Latest CPU utilisation, refreshed by the stats sampler thread
+_latest_cpu = 0.0
+
+def _cpu_sampler_loop():
+    """Sample CPU utilisation once per second in the background."""
+    global _latest_cpu
+    while True:
+        _latest_cpu = psutil.cpu_percent(interval=1.0)
+
+# Cleared once nvidia-smi turns out not to be installed
+_nvidia_smi_available = True
+
+def get_gpu_stats():
+    """Get GPU utilisation and memory (MiB), or None if no GPU is available."""
+    if _nvml_handle is not None:
+        try:
+            util = pynvml.nvmlDeviceGetUtilizationRates(_nvml_handle)
+            mem = pynvml.nvmlDeviceGetMemoryInfo(_nvml_handle)
+            return {
+                "utilization": int(util.gpu),
+                "memory_used": mem.used >> 20,
+                "memory_total": mem.total >> 20
+            }
+        except pynvml.NVMLError:
+            return None
+
+    # Fall back to nvidia-smi when NVML bindings are not installed
+    global _nvidia_smi_available
+    if not _nvidia_smi_available:
+        return None
     try:
         gpu_result = subprocess.run(
-            "nvidia-smi --query-gpu=utilization.gpu,memory.used,memory.total --format=csv,noheader,nounits",
-            shell=True, capture_output=True, text=True
+            ["nvidia-smi", "--query-gpu=utilization.gpu,memory.used,memory.total",
+             "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=5
         )
         if gpu_result.returncode == 0:
             gpu_util, gpu_mem_used, gpu_mem_total = gpu_result.stdout.strip().split(',')
-            gpu_stats = {
+            return {
                 "utilization": int(gpu_util.strip()),
                 "memory_used": int(gpu_mem_used.strip()),
                 "memory_total": int(gpu_mem_total.strip())
             }
-        else:
-            gpu_stats = None
+    except FileNotFoundError:
+        # No GPU tooling on this host; don't fork for it on every poll
+        _nvidia_smi_available = False
     except:
-        gpu_stats = None
+        pass
+    return None
+
+@ttl_cache(ttl=1.0)
+def get_system_stats():
+    """Get system statistics (cached briefly)."""
+    cpu_percent = _latest_cpu
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage('/')
+
+    gpu_stats = get_gpu_stats()
 
     return {
         "cpu": cpu_percent,
@@ -190,36 +500,44 @@ def get_system_stats():
         "gpu": gpu_stats
     }
 
+def enqueue_job(job: Job) -> bool:
+    """Persist a new job and put it on the queue.
+
+    Args:
+        job: Job to submit
+
+    Returns:
+        True if queued, False if the queue is full (the job is marked failed)
+    """
+    job_store.save(job)
+    if job_queue.enqueue(job):
+        return True
+    job_store.update(job.id, status=JobStatus.FAILED, error="Job queue is full")
+    return False
+
 def send_telegram_notification(job: Job):
     """Send Telegram notification for completed job."""
+    telegram_api = STATE.telegram_api
     if not telegram_api or not runtime_config.get_telegram_enabled():
         return
 
     chat_id = job.telegram_chat_id
     if not chat_id:
-        chat_id = TELEGRAM_DEFAULT_CHAT_ID
+        chat_id = STATE.telegram_default_chat_id
 
     if not chat_id:
         return
 
     try:
         if job.status == JobStatus.COMPLETED and job.files:
-            # Check for video or audio files
-            video_file = None
-            audio_file = None
-
-            for f in job.files:
-                if f.endswith(('.mp4', '.avi', '.mov', '.gif')):
-                    video_file = f
-                    break
-                elif f.endswith(('.mp3', '.wav', '.ogg', '.m4a')):
-                    audio_file = f
-                    break
+            video_file = job.video_file
+            audio_file = job.audio_file
 
             # Build fallback link
             link = None
-            if PUBLIC_BASE_URL:
-                link = f"{PUBLIC_BASE_URL}/api/jobs/{job.id}/result"
+            public_base_url = STATE.public_base_url
+            if public_base_url:
+                link = f"{public_base_url}/api/jobs/{job.id}/result"
 
             if video_file:
                 video_path = job_store.get_output_dir(job.id) / video_file
@@ -241,11 +559,30 @@ def send_telegram_notification(job: Job):
     except Exception as e:
         print(f"Failed to send Telegram notification: {e}")
 
+def _advise_sequential(response):
+    """Hint the kernel that a send_file() response will be read front to back.
+
+    POSIX_FADV_SEQUENTIAL enlarges readahead on the open file, which helps
+    when several large outputs are streamed at once. Best effort: skipped
+    when the platform lacks posix_fadvise or the body is not a plain file.
+    """
+    body = response.response
+    fileobj = getattr(body, 'file', None) or getattr(getattr(body, 'iterable', None), 'file', None)
+    if fileobj is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fileobj.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except (OSError, AttributeError, ValueError):
+        pass
+
 # ===== Flask Middleware =====
 
 @app.before_request
 def limit_remote_addr():
     """Limit access to local network."""
+    # Telegram delivers from the internet; the webhook checks its secret token
+    if TELEGRAM_WEBHOOK_SECRET and request.path == '/telegram/webhook':
+        return
     if not is_local_network(request.remote_addr):
         return jsonify({"error": "Access denied"}), 403
 
@@ -256,63 +593,103 @@ def index():
     """Main dashboard page."""
     return render_template('index.html')
 
-@app.route('/api/status')
-def status():
-    """Get status of all services."""
-    services = {
-        "ollama": get_service_status("ollama"),
-        "comfyui": get_service_status("comfyui"),
-        "sunshine": get_service_status("sunshine"),
-        "open_webui": get_docker_status("open-webui"),
-        "docket_converter": get_docker_status("docket-converter")
-    }
+@ttl_cache(ttl=STATUS_CACHE_TTL)
+def _status_body(ip):
+    """Build the /api/status payload as JSON bytes (cached briefly).
+
+    Every open dashboard polls this, so concurrent polls share one
+    computation and one serialization.
+
+    Args:
+        ip: Host the client used to reach the dashboard
+
+    Returns:
+        JSON-encoded response body
+    """
+    services = dict(get_service_statuses(MONITORED_SERVICES))
+    for container, state in get_docker_statuses(MONITORED_CONTAINERS).items():
+        services[container.replace('-', '_')] = state
 
     stats = get_system_stats()
 
-    return jsonify({
+    return orjson.dumps({
         "services": services,
         "stats": stats,
         "hostname": socket.gethostname(),
-        "ip": request.host.split(':')[0],
+        "ip": ip,
         "docket_api_url": DOCKET_API_URL,
         "docket_web_url": DOCKET_WEB_URL
     })
 
+@app.route('/api/status')
+def status():
+    """Get status of all services."""
+    return Response(_status_body(request.host.split(':')[0]), mimetype='application/json')
+
 @app.route('/api/service/<service>/<action>', methods=['POST'])
 def control_service(service, action):
     """Control a service (start/stop/restart)."""
-    allowed_services = ['ollama', 'comfyui', 'sunshine']
-    allowed_actions = ['start', 'stop', 'restart']
-
-    if service not in allowed_services or action not in allowed_actions:
+    if service not in ALLOWED_SERVICES or action not in ALLOWED_ACTIONS:
         return jsonify({"success": False, "error": "Invalid service or action"}), 400
 
-    cmd = f"sudo systemctl {action} {service}"
-    result = run_command(cmd)
+    result = run_command(["sudo", "systemctl", action, service])
+    get_service_statuses.cache_clear()
+    _status_body.cache_clear()
     return jsonify(result)
 
 @app.route('/api/docker/<container>/<action>', methods=['POST'])
 def control_docker(container, action):
     """Control a Docker container."""
-    if container not in ['open-webui', 'docket-converter']:
+    if container not in ALLOWED_CONTAINERS:
         return jsonify({"success": False, "error": "Invalid container"}), 400
 
-    if action not in ['start', 'stop', 'restart']:
+    if action not in ALLOWED_ACTIONS:
         return jsonify({"success": False, "error": "Invalid action"}), 400
 
-    cmd = f"docker {action} {container}"
-    result = run_command(cmd)
+    result = run_command(["docker", action, container])
+    get_docker_statuses.cache_clear()
+    _status_body.cache_clear()
     return jsonify(result)
 
 @app.route('/api/ollama/kill-models', methods=['POST'])
 def kill_ollama_models():
     """Kill all running Ollama models."""
-    cmd = "sudo systemctl restart ollama"
-    result = run_command(cmd)
+    result = run_command(["sudo", "systemctl", "restart", "ollama"])
+    get_service_statuses.cache_clear()
+    _status_body.cache_clear()
     return jsonify(result)
 
 # ===== Docket Proxy Routes =====
 
+PROXY_CHUNK_SIZE = 64 * 1024
+
+# Per-connection headers that must not be forwarded by a proxy
+_HOP_BY_HOP_HEADERS = frozenset({
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade'
+})
+
+def _stream_upstream(resp, headers):
+    """Build a Flask response that streams an upstream body as it arrives.
+
+    The body is relayed undecoded, so Content-Encoding/Content-Length from
+    upstream remain valid.
+
+    Args:
+        resp: requests Response opened with stream=True
+        headers: Headers to send to the client
+
+    Returns:
+        Flask Response
+    """
+    response = Response(
+        resp.raw.stream(PROXY_CHUNK_SIZE, decode_content=False),
+        status=resp.status_code,
+        headers=headers
+    )
+    response.call_on_close(resp.close)
+    return response
+
 @app.route('/docx/')
 @app.route('/docx/<path:path>')
 def docket_proxy(path=''):
@@ -326,10 +703,11 @@ def docket_proxy(path=''):
             target_url += f"?{request.query_string.decode()}"
 
         # Make request
-        resp = requests.get(target_url, timeout=10)
+        resp = docket_session.get(target_url, stream=True, timeout=10)
 
-        # Return response
-        return resp.content, resp.status_code, resp.headers.items()
+        # Stream response back
+        headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in _HOP_BY_HOP_HEADERS]
+        return _stream_upstream(resp, headers)
     except requests.exceptions.RequestException as e:
         return jsonify({
             "error": "Docket service unavailable",
@@ -340,7 +718,7 @@ def docket_proxy(path=''):
 def docket_health():
     """Check Docket API health."""
     try:
-        resp = requests.get(f"{DOCKET_API_URL}/api/health", timeout=5)
+        resp = docket_session.get(f"{DOCKET_API_URL}/api/health", timeout=5)
         return jsonify({
             "reachable": resp.status_code == 200,
             "status": resp.status_code
@@ -358,8 +736,8 @@ def docket_convert():
         # Forward POST request to Docket API
         target_url = f"{DOCKET_API_URL}/api/convert"
 
-        # Get the request body
-        body = request.get_json()
+        # Get the raw request body; Docket parses it, so we don't
+        body = request.get_data(cache=False)
         if not body:
             return jsonify({
                 "error": "Bad Request",
@@ -367,19 +745,20 @@ def docket_convert():
             }), 400
 
         # Forward the request body and headers
-        resp = requests.post(
+        resp = docket_session.post(
             target_url,
-            json=body,
-            headers={'Content-Type': 'application/json'},
+            data=body,
+            headers={'Content-Type': request.headers.get('Content-Type', 'application/json')},
+            stream=True,
             timeout=30  # Conversion can take time
         )
 
-        # Return the response with appropriate headers
-        response = make_response(resp.content, resp.status_code)
-        response.headers['Content-Type'] = resp.headers.get('Content-Type', 'application/octet-stream')
-        if 'Content-Disposition' in resp.headers:
-            response.headers['Content-Disposition'] = resp.headers['Content-Disposition']
-        return response
+        # Stream the converted file back with the relevant headers
+        headers = {'Content-Type': resp.headers.get('Content-Type', 'application/octet-stream')}
+        for key in ('Content-Disposition', 'Content-Encoding', 'Content-Length'):
+            if key in resp.headers:
+                headers[key] = resp.headers[key]
+        return _stream_upstream(resp, headers)
     except requests.exceptions.RequestException as e:
         return jsonify({
             "error": "Docket service unavailable",
@@ -419,16 +798,17 @@ def create_image_to_video_job():
         return jsonify({"error": "input_image_url is required"}), 400
 
     # Validate URL scheme
-    if not input_image_url.startswith(('http://', 'https://', 'telegram://')):
+    if not URL_SCHEME_RE.match(input_image_url):
         return jsonify({"error": "Invalid input_image_url scheme"}), 400
 
     # Create job
-    job_id = str(uuid.uuid4())
+    job_id = Job.new_id()
+    now = Job.now()
     job = Job(
         id=job_id,
         status=JobStatus.QUEUED,
-        created_at=Job.now(),
-        updated_at=Job.now(),
+        created_at=now,
+        updated_at=now,
         prompt=prompt,
         input_image_url=input_image_url,
         telegram_chat_id=telegram_chat_id,
@@ -437,8 +817,10 @@ def create_image_to_video_job():
     )
 
     # Save and enqueue
-    job_store.save(job)
-    job_queue.enqueue(job)
+    if not enqueue_job(job):
+        response = jsonify({"error": "Job queue is full, try again later"})
+        response.headers['Retry-After'] = str(QUEUE_FULL_RETRY_AFTER)
+        return response, 503
 
     # Build response URLs
     base_url = request.host_url.rstrip('/')
@@ -453,11 +835,11 @@ def create_image_to_video_job():
 @app.route('/api/jobs/<job_id>', methods=['GET'])
 def get_job(job_id):
     """Get job status and metadata."""
-    job = job_store.load(job_id)
-    if not job:
+    body = job_store.load_json(job_id)
+    if body is None:
         return jsonify({"error": "Job not found"}), 404
 
-    return jsonify(job.to_dict())
+    return Response(body, mimetype='application/json')
 
 @app.route('/api/jobs/<job_id>/result', methods=['GET'])
 def get_job_result(job_id):
@@ -472,22 +854,37 @@ def get_job_result(job_id):
     if not job.files:
         return jsonify({"error": "No output files"}), 404
 
-    # Get first video file
-    video_file = None
-    for f in job.files:
-        if f.endswith(('.mp4', '.avi', '.mov', '.gif')):
-            video_file = f
-            break
-
-    if not video_file:
-        return jsonify({"error": "No video file found"}), 404
+    output_file = job.primary_output
+    if not output_file:
+        return jsonify({"error": "No media file found"}), 404
 
-    file_path = job_store.get_output_dir(job_id) / video_file
+    file_path = job_store.get_output_dir(job_id) / output_file
 
     if not file_path.exists():
         return jsonify({"error": "Output file not found"}), 404
 
-    return send_file(file_path, mimetype='video/mp4')
+    mimetype = mimetypes.guess_type(output_file)[0] or 'application/octet-stream'
+
+    # nginx serves the file itself from its internal location
+    if X_ACCEL_REDIRECT_PREFIX:
+        response = make_response('')
+        response.headers['Content-Type'] = mimetype
+        response.headers['X-Accel-Redirect'] = f"{X_ACCEL_REDIRECT_PREFIX}/{quote(job_id)}/output/{quote(output_file)}"
+        return response
+
+    # Emits X-Sendfile instead of the body when USE_X_SENDFILE is enabled.
+    # Otherwise the file goes out through the server's wsgi.file_wrapper;
+    # outputs never change once a job completes, so let clients revalidate
+    # (ETag / If-Modified-Since, Range) and cache them.
+    response = send_file(
+        file_path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=True,
+        max_age=RESULT_CACHE_MAX_AGE
+    )
+    _advise_sequential(response)
+    return response
 
 @app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
 def cancel_job(job_id):
@@ -504,14 +901,20 @@ def cancel_job(job_id):
 
 # ===== New Admin Routes =====
 
-@app.route('/api/admin/status', methods=['GET'])
-def admin_status():
-    """Get admin status for dashboard."""
+@ttl_cache(ttl=STATUS_CACHE_TTL)
+def _admin_status_body():
+    """Build the /api/admin/status payload as JSON bytes (cached briefly).
+
+    Returns:
+        JSON-encoded response body
+    """
     # Check ComfyUI reachability
+    comfy_client = STATE.comfy_client
     comfy_reachable = comfy_client.check_reachable()
     comfy_latency = comfy_client.get_latency_ms() if comfy_reachable else None
 
     # Worker status
+    job_worker = STATE.job_worker
     worker_running = job_worker is not None and job_worker.running
 
     # Job stats
@@ -521,14 +924,14 @@ def admin_status():
     # Telegram status
     telegram_status = {
         "enabled": runtime_config.get_telegram_enabled(),
-        "bot_name": TELEGRAM_BOT_NAME if TELEGRAM_BOT_NAME else None
+        "bot_name": STATE.telegram_bot_name or None
     }
 
-    return jsonify({
+    return orjson.dumps({
         "web_ui_server": "running",
         "comfyui": {
             "reachable": comfy_reachable,
-            "base_url": COMFYUI_BASE_URL,
+            "base_url": STATE.comfyui_base_url,
             "latency_ms": comfy_latency
         },
         "image_to_video_agent": {
@@ -539,6 +942,11 @@ def admin_status():
         "telegram": telegram_status
     })
 
+@app.route('/api/admin/status', methods=['GET'])
+def admin_status():
+    """Get admin status for dashboard."""
+    return Response(_admin_status_body(), mimetype='application/json')
+
 @app.route('/api/admin/telegram/enable', methods=['POST'])
 def set_telegram_enabled():
     """Enable/disable Telegram bot."""
@@ -548,6 +956,7 @@ def set_telegram_enabled():
 
     enabled = bool(data['enabled'])
     runtime_config.set_telegram_enabled(enabled)
+    _admin_status_body.cache_clear()
 
     return jsonify({
         "success": True,
@@ -565,24 +974,27 @@ def config_page():
 def get_config_status():
     """Get current configuration status."""
     # Check if Telegram is configured
-    telegram_configured = bool(TELEGRAM_BOT_TOKEN and TELEGRAM_BOT_NAME)
+    bot_name = STATE.telegram_bot_name
+    telegram_configured = bool(STATE.telegram_bot_token and bot_name)
 
     # Check if workflow exists
-    workflow_configured = WORKFLOW_PATH.exists()
-    workflow_mtime = None
-    if workflow_configured:
-        import datetime
-        mtime = WORKFLOW_PATH.stat().st_mtime
-        workflow_mtime = datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        st = WORKFLOW_PATH.stat()
+        workflow_configured = True
+        workflow_mtime = datetime.datetime.fromtimestamp(st.st_mtime).strftime(MTIME_FORMAT)
+    except FileNotFoundError:
+        workflow_configured = False
+        workflow_mtime = None
 
     # Check ComfyUI connection
+    comfy_client = STATE.comfy_client
     comfy_reachable = comfy_client.check_reachable()
     comfy_latency = comfy_client.get_latency_ms() if comfy_reachable else None
 
     return jsonify({
         "telegram": {
             "configured": telegram_configured,
-            "bot_name": TELEGRAM_BOT_NAME if telegram_configured else None
+            "bot_name": bot_name if telegram_configured else None
         },
         "workflow": {
             "configured": workflow_configured,
@@ -590,7 +1002,7 @@ def get_config_status():
             "last_updated": workflow_mtime
         },
         "comfyui": {
-            "url": COMFYUI_BASE_URL,
+            "url": STATE.comfyui_base_url,
             "reachable": comfy_reachable,
             "latency_ms": comfy_latency
         }
@@ -612,14 +1024,17 @@ def save_telegram_config():
     if not bot_token or not bot_name:
         return jsonify({"success": False, "error": "bot_token and bot_name are required"}), 400
 
+    # Nothing to do if the settings match what is already running
+    current = (STATE.telegram_bot_token, STATE.telegram_bot_name,
+               STATE.telegram_default_chat_id, STATE.public_base_url)
+    if current == (bot_token, bot_name, default_chat_id, public_url) and STATE.telegram_api:
+        return jsonify({"success": True, "message": "No changes"})
+
     # Save to environment file
     env_file = Path('/etc/server-dashboard.env')
-    env_lines = []
 
     # Read existing env file if it exists
-    if env_file.exists():
-        with open(env_file, 'r') as f:
-            env_lines = f.readlines()
+    env_lines = env_file.read_text().splitlines(keepends=True) if env_file.exists() else []
 
     # Update or add Telegram variables
     telegram_vars = {
@@ -630,23 +1045,18 @@ def save_telegram_config():
         'TELEGRAM_ENABLED': 'true'
     }
 
-    # Update existing lines or collect new ones
+    # Rewrite matching KEY= lines in place; everything else (comments, blank
+    # lines, lines the parser doesn't understand) is kept verbatim
     updated_vars = set()
     new_env_lines = []
-
     for line in env_lines:
-        line = line.strip()
-        if not line or line.startswith('#'):
-            new_env_lines.append(line + '\n')
-            continue
-
-        if '=' in line:
-            key = line.split('=', 1)[0].strip()
-            if key in telegram_vars:
-                new_env_lines.append(f'{key}={telegram_vars[key]}\n')
-                updated_vars.add(key)
-            else:
-                new_env_lines.append(line + '\n')
+        match = _ENV_LINE_RE.match(line)
+        key = match.group(1) if match else None
+        if key in telegram_vars:
+            new_env_lines.append(f'{key}={telegram_vars[key]}\n')
+            updated_vars.add(key)
+        else:
+            new_env_lines.append(line if line.endswith('\n') else line + '\n')
 
     # Add any variables that weren't in the file
     for key, value in telegram_vars.items():
@@ -655,37 +1065,38 @@ def save_telegram_config():
 
     # Write to temp file first (we don't have sudo access in Flask)
     temp_file = Path('./telegram_config.env')
-    with open(temp_file, 'w') as f:
-        f.writelines(new_env_lines)
+    temp_file.write_text(''.join(new_env_lines))
 
-    # Update in-memory globals (for immediate effect)
-    global TELEGRAM_BOT_TOKEN, TELEGRAM_BOT_NAME, TELEGRAM_DEFAULT_CHAT_ID, PUBLIC_BASE_URL, telegram_api
-    TELEGRAM_BOT_TOKEN = bot_token
-    TELEGRAM_BOT_NAME = bot_name
-    TELEGRAM_DEFAULT_CHAT_ID = default_chat_id
-    PUBLIC_BASE_URL = public_url
+    with STATE.lock:
+        # Update in-memory state (for immediate effect)
+        STATE.telegram_bot_token = bot_token
+        STATE.telegram_bot_name = bot_name
+        STATE.telegram_default_chat_id = default_chat_id
+        STATE.public_base_url = public_url
 
-    # Reinitialize Telegram API
-    telegram_api = TelegramAPI(bot_token)
+        # Reinitialize Telegram API (keeping the client, and its warm
+        # connections, when only the name, chat or URL changed)
+        if not STATE.telegram_api or STATE.telegram_api.bot_token != bot_token:
+            STATE.telegram_api = TelegramAPI(bot_token)
 
-    # Reinitialize webhook if blueprint is registered
-    if telegram_api:
+        # Reinitialize webhook if blueprint is registered
         init_webhook(
-            telegram_api=telegram_api,
+            telegram_api=STATE.telegram_api,
             telegram_enabled_func=runtime_config.get_telegram_enabled,
-            enqueue_job_func=lambda job: (job_store.save(job), job_queue.enqueue(job)),
-            storage_root=STORAGE_ROOT
+            enqueue_job_func=enqueue_job,
+            storage_root=STORAGE_ROOT,
+            secret_token=TELEGRAM_WEBHOOK_SECRET
         )
 
-    # Restart poller with new config
-    global telegram_poller
-    print(f"[DEBUG] About to restart poller, current telegram_api={telegram_api}", flush=True)
-    if telegram_poller:
-        print("[DEBUG] Stopping existing poller", flush=True)
-        telegram_poller.stop()
-    print("[DEBUG] Calling init_telegram_poller()", flush=True)
-    init_telegram_poller()
-    print(f"[DEBUG] Finished init_telegram_poller(), telegram_poller={telegram_poller}", flush=True)
+        # Restart poller with new config
+        print(f"[DEBUG] About to restart poller, current telegram_api={STATE.telegram_api}", flush=True)
+        if STATE.telegram_poller:
+            print("[DEBUG] Stopping existing poller", flush=True)
+            STATE.telegram_poller.stop()
+        print("[DEBUG] Calling init_telegram_poller()", flush=True)
+        init_telegram_poller()
+        print(f"[DEBUG] Finished init_telegram_poller(), telegram_poller={STATE.telegram_poller}", flush=True)
+    _admin_status_body.cache_clear()
 
     return jsonify({
         "success": True,
@@ -695,14 +1106,13 @@ def save_telegram_config():
 @app.route('/api/config/telegram/test', methods=['POST'])
 def test_telegram_config():
     """Test Telegram connection."""
+    telegram_api = STATE.telegram_api
     if not telegram_api:
         return jsonify({"success": False, "error": "Telegram not configured"}), 400
 
     try:
         # Get bot info
-        response = telegram_api.session.get(f"{telegram_api.base_url}/getMe", timeout=10)
-        response.raise_for_status()
-        bot_info = response.json()
+        bot_info = telegram_api.get_me()
 
         if bot_info.get('ok'):
             return jsonify({
@@ -733,23 +1143,25 @@ def save_workflow_config():
     # Validate JSON
     try:
         if isinstance(workflow_json, str):
-            workflow = json.loads(workflow_json)
+            workflow = orjson.loads(workflow_json)
         else:
             workflow = workflow_json
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         return jsonify({"success": False, "error": f"Invalid JSON: {str(e)}"}), 400
 
     # Save workflow
     try:
         WORKFLOW_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(WORKFLOW_PATH, 'w') as f:
-            json.dump(workflow, f, indent=2)
+        with open(WORKFLOW_PATH, 'wb') as f:
+            f.write(orjson.dumps(workflow, option=orjson.OPT_INDENT_2))
 
-        # Restart worker to pick up new workflow
-        global job_worker
-        if job_worker:
-            job_worker.stop()
-            init_worker()
+        # Swap the new workflow into the running worker (or start one)
+        with STATE.lock:
+            if STATE.job_worker:
+                STATE.job_worker.reload_workflow()
+            else:
+                init_worker()
+        _admin_status_body.cache_clear()
 
         return jsonify({
             "success": True,
@@ -771,15 +1183,15 @@ def save_comfyui_config():
 
     url = data['url'].strip()
 
-    # Update in-memory global
-    global COMFYUI_BASE_URL, comfy_client
-    COMFYUI_BASE_URL = url
-    comfy_client = ComfyUIClient(url)
+    with STATE.lock:
+        # Update in-memory state
+        STATE.comfyui_base_url = url
+        STATE.comfy_client = ComfyUIClient(url)
 
-    # Update worker's client
-    global job_worker
-    if job_worker:
-        job_worker.comfy_client = comfy_client
+        # Update worker's client
+        if STATE.job_worker:
+            STATE.job_worker.comfy_client = STATE.comfy_client
+    _admin_status_body.cache_clear()
 
     # Save to temp config file
     temp_file = Path('./comfyui_config.env')
@@ -795,7 +1207,7 @@ def save_comfyui_config():
 def test_comfyui_config():
     """Test ComfyUI connection."""
     try:
-        latency = comfy_client.get_latency_ms()
+        latency = STATE.comfy_client.get_latency_ms(max_age=0)
         if latency is not None:
             return jsonify({
                 "success": True,
@@ -814,66 +1226,112 @@ def test_comfyui_config():
 
 # ===== Register Telegram Blueprint =====
 
-if telegram_api:
+if STATE.telegram_api:
     app.register_blueprint(telegram_bp)
     init_webhook(
-        telegram_api=telegram_api,
+        telegram_api=STATE.telegram_api,
         telegram_enabled_func=runtime_config.get_telegram_enabled,
-        enqueue_job_func=lambda job: (job_store.save(job), job_queue.enqueue(job)),
-        storage_root=STORAGE_ROOT
+        enqueue_job_func=enqueue_job,
+        storage_root=STORAGE_ROOT,
+        secret_token=TELEGRAM_WEBHOOK_SECRET
     )
 
 # ===== Initialization =====
 
 def init_worker():
     """Initialize and start job worker."""
-    global job_worker
-
     if not WORKFLOW_PATH.exists():
         print(f"[WARN] Workflow not found at {WORKFLOW_PATH}, worker not started", flush=True)
         return
 
     print(f"[INFO] Using workflow: {WORKFLOW_PATH}", flush=True)
-    job_worker = JobWorker(
-        queue=job_queue,
-        store=job_store,
-        comfy_client=comfy_client,
-        workflow_path=WORKFLOW_PATH,
-        telegram_send_func=send_telegram_notification,
-        timeout_minutes=10
-    )
-    job_worker.start()
+    with STATE.lock:
+        STATE.job_worker = JobWorker(
+            queue=job_queue,
+            store=job_store,
+            comfy_client=STATE.comfy_client,
+            workflow_path=WORKFLOW_PATH,
+            telegram_send_func=send_telegram_notification,
+            timeout_minutes=10,
+            song_workflow_path=SONG_WORKFLOW_PATH,
+            concurrency=JOB_WORKERS
+        )
+        STATE.job_worker.start()
     print("[INFO] Job worker started", flush=True)
 
-def init_telegram_poller():
-    """Initialize and start Telegram poller."""
-    global telegram_poller
+def init_stats_sampler():
+    """Start the background CPU sampler thread."""
+    threading.Thread(target=_cpu_sampler_loop, daemon=True).start()
 
-    print(f"[DEBUG] init_telegram_poller called, telegram_api={telegram_api}, enabled={runtime_config.get_telegram_enabled()}", flush=True)
+def telegram_webhook_url() -> str:
+    """Public webhook URL for Telegram, or "" when updates must be polled.
 
-    if not telegram_api:
-        print("[WARN] Telegram API not configured, poller not started", flush=True)
-        return
+    Telegram only pushes to HTTPS URLs, and the route is opened to the
+    internet only when it is protected by TELEGRAM_WEBHOOK_SECRET.
+    """
+    public_base_url = STATE.public_base_url
+    if TELEGRAM_WEBHOOK_SECRET and public_base_url.startswith('https://') and 'telegram' in app.blueprints:
+        return f"{public_base_url.rstrip('/')}/telegram/webhook"
+    return ""
 
-    telegram_poller = TelegramPoller(
-        telegram_api=telegram_api,
-        telegram_enabled_func=runtime_config.get_telegram_enabled,
-        enqueue_job_func=lambda job: (job_store.save(job), job_queue.enqueue(job)),
-        storage_root=STORAGE_ROOT
-    )
-    telegram_poller.start()
+def init_telegram_poller():
+    """Initialize Telegram update delivery.
+
+    Registers the webhook when one is configured; otherwise (or if that
+    fails) starts the long-polling poller.
+    """
+    with STATE.lock:
+        telegram_api = STATE.telegram_api
+
+        print(f"[DEBUG] init_telegram_poller called, telegram_api={telegram_api}, enabled={runtime_config.get_telegram_enabled()}", flush=True)
+
+        if not telegram_api:
+            print("[WARN] Telegram API not configured, poller not started", flush=True)
+            return
+
+        webhook_url = telegram_webhook_url()
+        if webhook_url:
+            try:
+                telegram_api.set_webhook(webhook_url, TELEGRAM_WEBHOOK_SECRET)
+                STATE.telegram_poller = None
+                print(f"[INFO] Telegram webhook registered at {webhook_url}, poller not started", flush=True)
+                return
+            except Exception as e:
+                print(f"[WARN] Could not register Telegram webhook ({e}), falling back to polling", flush=True)
+
+        # getUpdates is refused (409) while a webhook is set, e.g. one left
+        # over from an earlier run with TELEGRAM_WEBHOOK_SECRET configured
+        try:
+            telegram_api.delete_webhook()
+        except Exception as e:
+            print(f"[WARN] Could not delete Telegram webhook: {e}", flush=True)
+
+        STATE.telegram_poller = TelegramPoller(
+            telegram_api=telegram_api,
+            telegram_enabled_func=runtime_config.get_telegram_enabled,
+            enqueue_job_func=enqueue_job,
+            storage_root=STORAGE_ROOT
+        )
+        STATE.telegram_poller.start()
     print("[INFO] Telegram poller started", flush=True)
 
 # ===== Main =====
 
 if __name__ == '__main__':
+    # Start system stats sampling
+    init_stats_sampler()
+
     # Initialize worker
     init_worker()
 
     # Initialize Telegram poller
     init_telegram_poller()
 
-    # Run Flask
+    # Serve with waitress: one process (the job worker, queue and poller live
+    # in-process) with a thread pool so slow requests don't block polling
+    from waitress import serve
+
     host = get_env("DASHBOARD_BIND", "0.0.0.0")
     port = int(get_env("DASHBOARD_PORT", "5000"))
-    app.run(host=host, port=port, debug=False)
+    threads = int(get_env("DASHBOARD_THREADS", "16"))
+    serve(app, host=host, port=port, threads=threads)
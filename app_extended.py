@@ -7,6 +7,8 @@ from flask import Flask, render_template, jsonify, request, send_file
 import subprocess
 import psutil
 import os
+import functools
+import ipaddress
 import socket
 import json
 import uuid
@@ -54,6 +56,12 @@ TELEGRAM_DEFAULT_CHAT_ID = get_env("TELEGRAM_DEFAULT_CHAT_ID", "")
 # Runtime config file
 CONFIG_FILE = Path("./config.json")
 
+# Networks allowed to reach the dashboard
+LOCAL_NETWORKS = (
+    ipaddress.ip_network('192.168.0.0/16'),
+    ipaddress.ip_network('127.0.0.0/8'),
+)
+
 # ===== Runtime Config =====
 
 class RuntimeConfig:
@@ -105,14 +113,24 @@ job_worker: Optional[JobWorker] = None
 
 # ===== Helper Functions =====
 
+@functools.lru_cache(maxsize=256)
 def is_local_network(ip):
-    """Check if IP is from local network."""
-    return ip.startswith('192.168.') or ip == '127.0.0.1' or ip == 'localhost'
-
-def run_command(cmd):
-    """Run a system command and return output."""
+    """Check if IP is from local network (cached per address)."""
+    if ip == 'localhost':
+        return True
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=10)
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    # Unwrap IPv4-mapped IPv6 (::ffff:192.168.x.y) from dual-stack sockets
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return any(addr in net for net in LOCAL_NETWORKS)
+
+def run_command(argv):
+    """Run a system command (argv list, no shell) and return output."""
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=10)
         return {"success": True, "output": result.stdout, "error": result.stderr}
     except subprocess.TimeoutExpired:
         return {"success": False, "error": "Command timed out"}
@@ -121,13 +139,13 @@ def run_command(cmd):
 
 def get_service_status(service):
     """Get systemd service status."""
-    result = subprocess.run(f"systemctl is-active {service}", shell=True, capture_output=True, text=True)
+    result = subprocess.run(["systemctl", "is-active", service], capture_output=True, text=True)
     return result.stdout.strip()
 
 def get_docker_status(container):
     """Get Docker container status."""
-    result = subprocess.run(f"docker inspect -f '{{{{.State.Running}}}}' {container} 2>/dev/null",
-                          shell=True, capture_output=True, text=True)
+    result = subprocess.run(["docker", "inspect", "-f", "{{.State.Running}}", container],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
     return "running" if result.stdout.strip() == "true" else "stopped"
 
 def get_system_stats():
@@ -139,8 +157,9 @@ def get_system_stats():
     # Get GPU stats
     try:
         gpu_result = subprocess.run(
-            "nvidia-smi --query-gpu=utilization.gpu,memory.used,memory.total --format=csv,noheader,nounits",
-            shell=True, capture_output=True, text=True
+            ["nvidia-smi", "--query-gpu=utilization.gpu,memory.used,memory.total",
+             "--format=csv,noheader,nounits"],
+            capture_output=True, text=True
         )
         if gpu_result.returncode == 0:
             gpu_util, gpu_mem_used, gpu_mem_total = gpu_result.stdout.strip().split(',')
@@ -169,6 +188,21 @@ def get_system_stats():
         "gpu": gpu_stats
     }
 
+def enqueue_job(job: Job) -> bool:
+    """Persist a new job and put it on the queue.
+
+    Args:
+        job: Job to submit
+
+    Returns:
+        True if queued, False if the queue is full (the job is marked failed)
+    """
+    job_store.save(job)
+    if job_queue.enqueue(job):
+        return True
+    job_store.update(job.id, status=JobStatus.FAILED, error="Job queue is full")
+    return False
+
 def send_telegram_notification(job: Job):
     """Send Telegram notification for completed job."""
     if not telegram_api or not runtime_config.get_telegram_enabled():
@@ -255,8 +289,7 @@ def control_service(service, action):
     if service not in allowed_services or action not in allowed_actions:
         return jsonify({"success": False, "error": "Invalid service or action"}), 400
 
-    cmd = f"sudo systemctl {action} {service}"
-    result = run_command(cmd)
+    result = run_command(["sudo", "systemctl", action, service])
     return jsonify(result)
 
 @app.route('/api/docker/<container>/<action>', methods=['POST'])
@@ -268,15 +301,13 @@ def control_docker(container, action):
     if action not in ['start', 'stop', 'restart']:
         return jsonify({"success": False, "error": "Invalid action"}), 400
 
-    cmd = f"docker {action} {container}"
-    result = run_command(cmd)
+    result = run_command(["docker", action, container])
     return jsonify(result)
 
 @app.route('/api/ollama/kill-models', methods=['POST'])
 def kill_ollama_models():
     """Kill all running Ollama models."""
-    cmd = "sudo systemctl restart ollama"
-    result = run_command(cmd)
+    result = run_command(["sudo", "systemctl", "restart", "ollama"])
     return jsonify(result)
 
 # ===== New Job Routes =====
@@ -330,8 +361,8 @@ def create_image_to_video_job():
     )
 
     # Save and enqueue
-    job_store.save(job)
-    job_queue.enqueue(job)
+    if not enqueue_job(job):
+        return jsonify({"error": "Job queue is full, try again later"}), 503
 
     # Build response URLs
     base_url = request.host_url.rstrip('/')
@@ -454,7 +485,7 @@ if telegram_api:
     init_webhook(
         telegram_api=telegram_api,
         telegram_enabled_func=runtime_config.get_telegram_enabled,
-        enqueue_job_func=lambda job: (job_store.save(job), job_queue.enqueue(job)),
+        enqueue_job_func=enqueue_job,
         storage_root=STORAGE_ROOT
     )
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Small in-process caching helpers."""
+
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+
+def ttl_cache(ttl: float, maxsize: int = 128) -> Callable:
+    """Memoize a function's results for a short, fixed time window.
+
+    Results are keyed by the call's positional and keyword arguments and
+    shared across threads. Once an entry is older than ``ttl`` seconds the
+    next call recomputes it. When more than ``maxsize`` entries are held, the
+    oldest one is evicted.
+
+    Concurrent misses on the same key are collapsed: one caller computes the
+    value while the others wait for it, so a burst of pollers triggers a
+    single refresh.
+
+    Args:
+        ttl: Time-to-live in seconds
+        maxsize: Maximum number of cached entries
+
+    Returns:
+        Decorator
+    """
+    def decorator(func: Callable) -> Callable:
+        entries: Dict[Tuple, Tuple[float, Any]] = {}
+        inflight: Dict[Tuple, threading.Event] = {}
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+
+            while True:
+                with lock:
+                    entry = entries.get(key)
+                    if entry is not None and time.monotonic() - entry[0] < ttl:
+                        return entry[1]
+                    pending = inflight.get(key)
+                    if pending is None:
+                        pending = inflight[key] = threading.Event()
+                        break
+                # Another thread is computing this key; wait and re-check
+                # (if it failed, the next loop iteration takes over)
+                pending.wait()
+
+            try:
+                value = func(*args, **kwargs)
+                with lock:
+                    entries.pop(key, None)
+                    entries[key] = (time.monotonic(), value)
+                    while len(entries) > maxsize:
+                        entries.pop(next(iter(entries)))
+                return value
+            finally:
+                with lock:
+                    inflight.pop(key, None)
+                pending.set()
+
+        def cache_clear():
+            """Drop all cached entries."""
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
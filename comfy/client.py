@@ -1,14 +1,50 @@
 #!/usr/bin/env python3
 """ComfyUI API client."""
 
+import orjson
+import os
+import shutil
+import socket
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 from pathlib import Path
 from typing import Optional, Dict, Any
 
+# Optional: push notifications over /ws instead of polling /history
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+# Errors that mean the event socket is unusable (callers fall back to polling)
+WS_ERRORS = (OSError,) if websocket is None else (websocket.WebSocketException, OSError)
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets use TCP keepalive (and TCP_NODELAY)."""
+
+    SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
 
 class ComfyUIClient:
     """Client for ComfyUI REST API."""
 
+    # Copy buffer for output downloads (videos are tens of MB)
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+    # How long a health probe result is reused, in seconds
+    HEALTH_TTL = 2.0
+
     def __init__(self, base_url: str, timeout: int = 300):
         """Initialize ComfyUI client.
 
@@ -18,13 +54,52 @@ class ComfyUIClient:
         """
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
+
+        # The worker polls /history and pulls /view on one host; keep a few
+        # warm connections and retry dropped ones (GETs only on read errors)
         self.session = requests.Session()
+        adapter = _KeepAliveAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.1)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Last health probe: (monotonic time, latency ms or None)
+        self._health: Optional[tuple] = None
+        self._health_lock = threading.Lock()
 
-    def queue_prompt(self, workflow: Dict[str, Any]) -> str:
+    def connect_ws(self, client_id: str, timeout: float = 10) -> "websocket.WebSocket":
+        """Open the ComfyUI event socket for a client ID.
+
+        Execution events for prompts queued with the same client_id are
+        pushed over this socket.
+
+        Args:
+            client_id: Client ID (also passed to queue_prompt)
+            timeout: Connect timeout in seconds
+
+        Returns:
+            Connected WebSocket
+
+        Raises:
+            OSError: If websocket-client is not installed or connect fails
+            websocket.WebSocketException: On handshake error
+        """
+        if websocket is None:
+            raise OSError("websocket-client is not installed")
+        ws_url = 'ws' + self.base_url[len('http'):] if self.base_url.startswith('http') else self.base_url
+        ws = websocket.WebSocket()
+        ws.connect(f"{ws_url}/ws?clientId={client_id}", timeout=timeout)
+        return ws
+
+    def queue_prompt(self, workflow: Dict[str, Any], client_id: Optional[str] = None) -> str:
         """Queue a prompt for execution.
 
         Args:
             workflow: Complete workflow JSON
+            client_id: Client ID whose event socket should receive progress
 
         Returns:
             Prompt ID
@@ -33,13 +108,16 @@ class ComfyUIClient:
             requests.RequestException: On API error
         """
         payload = {"prompt": workflow}
+        if client_id:
+            payload["client_id"] = client_id
         response = self.session.post(
             f"{self.base_url}/prompt",
-            json=payload,
+            data=orjson.dumps(payload),
+            headers={'Content-Type': 'application/json'},
             timeout=30
         )
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         return data['prompt_id']
 
     def get_history(self, prompt_id: str) -> Dict[str, Any]:
@@ -59,7 +137,7 @@ class ComfyUIClient:
             timeout=10
         )
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
     def download_output(
         self,
@@ -93,13 +171,33 @@ class ComfyUIClient:
             timeout=self.timeout
         )
         response.raise_for_status()
+        self.stream_to_file(response, dest_path)
+
+    def stream_to_file(self, response: requests.Response, dest_path: Path) -> None:
+        """Write a streamed response body to a file.
+
+        The body is copied in DOWNLOAD_CHUNK_SIZE blocks to a temp file that
+        is renamed into place, so a failed download never leaves a truncated
+        output behind (the rename moves no data). The written pages stay
+        in the page cache: the Telegram upload and the result endpoint read
+        the output back right after the job completes.
 
-        # Stream to file
+        Args:
+            response: Response opened with stream=True (closed on return)
+            dest_path: Local destination path
+        """
         dest_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(dest_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        tmp_path = dest_path.with_name(dest_path.name + '.part')
+        response.raw.decode_content = True
+        try:
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, self.DOWNLOAD_CHUNK_SIZE)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            response.close()
 
     def upload_image(self, image_path: Path, overwrite: bool = False) -> str:
         """Upload image to ComfyUI.
@@ -126,9 +224,41 @@ class ComfyUIClient:
             )
             response.raise_for_status()
 
-        result = response.json()
+        result = orjson.loads(response.content)
         return result.get('name', image_path.name)
 
+    def _probe(self, timeout: float, max_age: float) -> Optional[int]:
+        """Ping /system_stats, reusing a result younger than max_age.
+
+        Dashboard pages ask for reachability and latency on every poll; both
+        are answered by one request per HEALTH_TTL window.
+
+        Args:
+            timeout: Request timeout in seconds
+            max_age: Maximum age of a cached result in seconds
+
+        Returns:
+            Latency in milliseconds or None if unreachable
+        """
+        with self._health_lock:
+            if self._health and time.monotonic() - self._health[0] < max_age:
+                return self._health[1]
+
+            latency = None
+            try:
+                start = time.monotonic()
+                response = self.session.get(
+                    f"{self.base_url}/system_stats",
+                    timeout=timeout
+                )
+                if response.status_code == 200:
+                    latency = int((time.monotonic() - start) * 1000)
+            except Exception:
+                pass
+
+            self._health = (time.monotonic(), latency)
+            return latency
+
     def check_reachable(self, timeout: int = 5) -> bool:
         """Check if ComfyUI server is reachable.
 
@@ -138,31 +268,16 @@ class ComfyUIClient:
         Returns:
             True if reachable, False otherwise
         """
-        try:
-            response = self.session.get(
-                f"{self.base_url}/system_stats",
-                timeout=timeout
-            )
-            return response.status_code == 200
-        except Exception:
-            return False
+        return self._probe(timeout, self.HEALTH_TTL) is not None
 
-    def get_latency_ms(self) -> Optional[int]:
+    def get_latency_ms(self, max_age: Optional[float] = None) -> Optional[int]:
         """Measure latency to ComfyUI server.
 
+        Args:
+            max_age: Reuse a probe up to this many seconds old
+                (default HEALTH_TTL; 0 forces a fresh request)
+
         Returns:
             Latency in milliseconds or None if unreachable
         """
-        import time
-        try:
-            start = time.time()
-            response = self.session.get(
-                f"{self.base_url}/system_stats",
-                timeout=5
-            )
-            elapsed = (time.time() - start) * 1000
-            if response.status_code == 200:
-                return int(elapsed)
-        except Exception:
-            pass
-        return None
+        return self._probe(5, self.HEALTH_TTL if max_age is None else max_age)
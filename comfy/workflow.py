@@ -1,14 +1,26 @@
 #!/usr/bin/env python3
-"""ComfyUI workflow management - simple template replacement."""
+"""ComfyUI workflow management - template placeholder substitution."""
 
-import json
+import copy
+import functools
+import os
+import orjson
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Optional, Tuple
+
+
+@functools.lru_cache(maxsize=8)
+def _read_template(path: str, mtime_ns: int) -> str:
+    """Read a template file; cached until the file's mtime changes."""
+    with open(path, 'r') as f:
+        return f.read()
 
 
 def load_base(workflow_path: Path) -> str:
     """Load base workflow template as string.
 
+    The file is only re-read when its modification time changes.
+
     Args:
         workflow_path: Path to workflow JSON template file
 
@@ -18,8 +30,60 @@ def load_base(workflow_path: Path) -> str:
     Raises:
         FileNotFoundError: If workflow file doesn't exist
     """
-    with open(workflow_path, 'r') as f:
-        return f.read()
+    path = os.fspath(workflow_path)
+    return _read_template(path, os.stat(path).st_mtime_ns)
+
+
+# A placeholder slot: the path to a string value in the workflow and the
+# template text found there
+Slot = Tuple[Tuple[Any, ...], str]
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_template(template: str, markers: Tuple[str, ...]) -> Tuple[Dict[str, Any], Tuple[Slot, ...]]:
+    """Parse a template once and record every string value containing a marker.
+
+    Templates are long-lived strings (the worker keeps one), so each job only
+    copies the path to each recorded slot and assigns it.
+    """
+    workflow = orjson.loads(template)
+    slots = []
+
+    def walk(node, path):
+        items = node.items() if isinstance(node, dict) else enumerate(node)
+        for key, value in items:
+            if isinstance(value, str):
+                if any(marker in value for marker in markers):
+                    slots.append((path + (key,), value))
+            elif isinstance(value, (dict, list)):
+                walk(value, path + (key,))
+
+    walk(workflow, ())
+    return workflow, tuple(slots)
+
+
+def _render(template: str, markers: Tuple[str, ...], substitute: Callable[[str], str]) -> Dict[str, Any]:
+    """Fill each placeholder slot of a compiled template.
+
+    Only the containers on the way to a slot are copied; every other node
+    is shared with the cached template, so the result must not be mutated
+    beyond its slots (it is only serialized for ComfyUI).
+    """
+    base, slots = _compile_template(template, markers)
+    workflow = copy.copy(base)
+    # Containers already copied for this render: path prefix -> copy
+    copied = {(): workflow}
+    for path, value in slots:
+        target = workflow
+        for depth in range(1, len(path)):
+            prefix = path[:depth]
+            child = copied.get(prefix)
+            if child is None:
+                child = copied[prefix] = copy.copy(target[path[depth - 1]])
+                target[path[depth - 1]] = child
+            target = child
+        target[path[-1]] = substitute(value)
+    return workflow
 
 
 def apply_overrides(
@@ -46,22 +110,19 @@ def apply_overrides(
     Returns:
         Workflow dictionary ready for ComfyUI
     """
-    # Escape quotes for JSON
-    escaped_prompt = prompt.replace('"', '\\"').replace('\n', '\\n')
-
-    # IMPORTANT: Replace IMAGE_PLACEHOLDER first, then PLACEHOLDER
-    # (otherwise PLACEHOLDER inside IMAGE_PLACEHOLDER gets replaced)
-    workflow_str = base_template
+    # Values are assigned into the parsed graph, so no JSON escaping is needed.
+    # Split on IMAGE_PLACEHOLDER before PLACEHOLDER (otherwise PLACEHOLDER
+    # inside IMAGE_PLACEHOLDER gets replaced); without an image,
+    # IMAGE_PLACEHOLDER keeps its old behaviour of becoming IMAGE_<prompt>
+    image_value = input_filename if input_filename else 'IMAGE_' + prompt
 
-    # Replace image filename if provided
-    if input_filename:
-        workflow_str = workflow_str.replace('IMAGE_PLACEHOLDER', input_filename)
+    def substitute(value: str) -> str:
+        return image_value.join(
+            prompt.join(part.split('PLACEHOLDER'))
+            for part in value.split('IMAGE_PLACEHOLDER')
+        )
 
-    # Replace prompt
-    workflow_str = workflow_str.replace('PLACEHOLDER', escaped_prompt)
-
-    # Parse and return as dict
-    return json.loads(workflow_str)
+    return _render(base_template, ('PLACEHOLDER',), substitute)
 
 
 def apply_song_overrides(
@@ -80,17 +141,10 @@ def apply_song_overrides(
     Returns:
         Workflow dictionary ready for ComfyUI
     """
-    # Escape quotes for JSON
-    escaped_description = description.replace('"', '\\"').replace('\n', '\\n')
-    escaped_lyrics = lyrics.replace('"', '\\"').replace('\n', '\\n')
-
-    # Replace placeholders
-    workflow_str = base_template
-    workflow_str = workflow_str.replace('DESCRIPTION-OF-SONG', escaped_description)
-    workflow_str = workflow_str.replace('LYRICS-OF-SONG', escaped_lyrics)
+    def substitute(value: str) -> str:
+        return value.replace('DESCRIPTION-OF-SONG', description).replace('LYRICS-OF-SONG', lyrics)
 
-    # Parse and return as dict
-    return json.loads(workflow_str)
+    return _render(base_template, ('DESCRIPTION-OF-SONG', 'LYRICS-OF-SONG'), substitute)
 
 
 def validate_params(
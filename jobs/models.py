@@ -1,12 +1,48 @@
 #!/usr/bin/env python3
 """Job data models and enums."""
 
-from dataclasses import dataclass, field, asdict
+import itertools
+import os
+import secrets
+import time
+from dataclasses import dataclass, field, fields
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import datetime
 
 
+# Output file suffix -> media kind
+_MEDIA_KIND = {
+    '.mp4': 'video', '.avi': 'video', '.mov': 'video', '.gif': 'video',
+    '.mp3': 'audio', '.wav': 'audio', '.ogg': 'audio', '.m4a': 'audio',
+}
+
+
+def find_media_files(files: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Find the first video and first audio file in a list of outputs.
+
+    Args:
+        files: Output filenames
+
+    Returns:
+        (video_file, audio_file), either may be None
+    """
+    found = {}
+    for f in files:
+        kind = _MEDIA_KIND.get(os.path.splitext(f)[1].lower())
+        if kind and kind not in found:
+            found[kind] = f
+            if len(found) == 2:
+                break
+    return found.get('video'), found.get('audio')
+
+
+# Job ID generator: a millisecond-seeded counter keeps IDs unique and roughly
+# ordered within the process; the random half (from the OS CSPRNG) keeps them
+# unguessable and distinct across restarts.
+_JOB_SEQ = itertools.count(int(time.time() * 1000))
+
+
 class JobStatus(str, Enum):
     """Job status states."""
     QUEUED = "queued"
@@ -17,7 +53,7 @@ class JobStatus(str, Enum):
     CANCELED = "canceled"
 
 
-@dataclass
+@dataclass(slots=True)
 class Job:
     """Job data model."""
     id: str
@@ -37,6 +73,10 @@ class Job:
     files: List[str] = field(default_factory=list)
     error: Optional[str] = None
 
+    # Primary media outputs, picked from files at completion
+    video_file: Optional[str] = None
+    audio_file: Optional[str] = None
+
     # Delivery
     telegram_chat_id: Optional[str] = None
     webhook_url: Optional[str] = None
@@ -44,9 +84,14 @@ class Job:
     # Parameters
     params: dict = field(default_factory=dict)
 
+    @property
+    def primary_output(self) -> Optional[str]:
+        """The output served as the job's result: the video, else the audio."""
+        return self.video_file or self.audio_file
+
     def to_dict(self):
-        """Convert to dictionary."""
-        d = asdict(self)
+        """Convert to dictionary (shallow; list/dict fields are shared)."""
+        d = {name: getattr(self, name) for name in JOB_FIELDS}
         d['status'] = self.status.value
         return d
 
@@ -56,9 +101,21 @@ class Job:
         d = d.copy()
         if 'status' in d and isinstance(d['status'], str):
             d['status'] = JobStatus(d['status'])
+        # Jobs stored before media fields existed
+        if d.get('files') and 'video_file' not in d:
+            d['video_file'], d['audio_file'] = find_media_files(d['files'])
         return cls(**d)
 
+    @staticmethod
+    def new_id() -> str:
+        """Generate a new unique job ID (32 hex characters)."""
+        return f"{next(_JOB_SEQ):016x}{secrets.randbits(64):016x}"
+
     @staticmethod
     def now():
         """Get current ISO timestamp."""
         return datetime.utcnow().isoformat() + 'Z'
+
+
+# Job field names, in declaration order
+JOB_FIELDS = tuple(f.name for f in fields(Job))
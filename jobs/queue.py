@@ -2,43 +2,87 @@
 """Job queue wrapper."""
 
 import queue
-from typing import Optional
+import threading
+from typing import List, Optional
 from .models import Job
 
 
 class JobQueue:
-    """Thread-safe job queue wrapper."""
+    """Thread-safe job queue wrapper.
 
-    def __init__(self):
-        """Initialize job queue."""
-        self._queue = queue.Queue()
+    Jobs are spread over one shard per worker by job ID. A worker takes from
+    its own shard first and steals from the others when it is empty, so a
+    single worker (the default) still sees every job.
 
-    def enqueue(self, job: Job) -> None:
+    With a maxsize, enqueue() refuses jobs once that many are waiting so
+    callers can shed load instead of building an unbounded backlog.
+    """
+
+    def __init__(self, num_shards: int = 1, maxsize: int = 0):
+        """Initialize job queue.
+
+        Args:
+            num_shards: Number of shards (normally one per worker)
+            maxsize: Maximum number of queued jobs (0 = unbounded)
+        """
+        # SimpleQueue is implemented in C: put() never blocks or takes the
+        # Python-level mutex/condition pair that queue.Queue uses
+        self._shards: List[queue.SimpleQueue] = [queue.SimpleQueue() for _ in range(max(1, num_shards))]
+        # Counts queued jobs across all shards; a successful acquire
+        # reserves one job for the caller
+        self._available = threading.Semaphore(0)
+        # Free slots when bounded
+        self._capacity = threading.Semaphore(maxsize) if maxsize > 0 else None
+
+    @property
+    def num_shards(self) -> int:
+        """Number of shards."""
+        return len(self._shards)
+
+    def enqueue(self, job: Job) -> bool:
         """Add job to queue.
 
         Args:
             job: Job to enqueue
+
+        Returns:
+            True if queued, False if the queue is full
         """
-        self._queue.put(job)
+        if self._capacity is not None and not self._capacity.acquire(blocking=False):
+            return False
+        self._shards[hash(job.id) % len(self._shards)].put(job)
+        self._available.release()
+        return True
 
-    def dequeue(self, timeout: Optional[float] = None) -> Optional[Job]:
+    def dequeue(self, timeout: Optional[float] = None, shard_id: int = 0) -> Optional[Job]:
         """Remove and return job from queue (blocking).
 
         Args:
             timeout: Timeout in seconds (None = block forever)
+            shard_id: Shard to take from first (the caller's own)
 
         Returns:
             Job instance or None if timeout
         """
-        try:
-            return self._queue.get(timeout=timeout)
-        except queue.Empty:
+        if not self._available.acquire(timeout=timeout):
             return None
 
+        # One job is reserved for us; own shard first, then steal round-robin
+        n = len(self._shards)
+        while True:
+            for i in range(n):
+                try:
+                    job = self._shards[(shard_id + i) % n].get_nowait()
+                except queue.Empty:
+                    continue
+                if self._capacity is not None:
+                    self._capacity.release()
+                return job
+
     def size(self) -> int:
         """Get current queue size."""
-        return self._queue.qsize()
+        return sum(shard.qsize() for shard in self._shards)
 
     def empty(self) -> bool:
         """Check if queue is empty."""
-        return self._queue.empty()
+        return all(shard.empty() for shard in self._shards)
@@ -1,15 +1,60 @@
 #!/usr/bin/env python3
 """File-backed job storage."""
 
-import json
+import atexit
+import copy
+import orjson
 import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
-from .models import Job, JobStatus
+from typing import Dict, Optional, Set
+from .models import Job, JobStatus, JOB_FIELDS
+
+
+_JOB_FIELD_SET = frozenset(JOB_FIELDS)
+
+# Flushes file data without forcing a separate inode (mtime) update where
+# the platform has it; the rename makes the new file visible either way
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+
+def _copy_job(job: Job) -> Job:
+    """Copy a job along with its files list and params dict."""
+    job = copy.copy(job)
+    job.files = list(job.files)
+    job.params = copy.deepcopy(job.params)
+    return job
+
+
+# Statuses after which a job no longer changes
+TERMINAL_STATUSES = frozenset({
+    JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.TIMED_OUT, JobStatus.CANCELED
+})
 
 
 class JobStore:
-    """File-backed job metadata storage."""
+    """File-backed job metadata storage.
+
+    Recently used jobs are kept in memory. Updates change the cached job and
+    are written to disk by a background flusher (write-behind); jobs reaching
+    a terminal status, and save() calls, are written straight through.
+
+    Disk writes happen outside the cache lock, so a slow disk never blocks
+    load(). They are serialized by a separate write lock (always taken
+    before the cache lock), and each job is encoded while that lock is held,
+    so writes reach the disk in order.
+    """
+
+    # How often the flusher writes dirty jobs, in seconds
+    FLUSH_INTERVAL = 0.25
+
+    # Maximum number of jobs kept in memory (dirty jobs are never evicted)
+    CACHE_SIZE = 256
+
+    # Wait before the flusher retries failed writes, in seconds
+    RETRY_INTERVAL = 5.0
 
     def __init__(self, storage_root: str):
         """Initialize job store.
@@ -20,6 +65,25 @@ class JobStore:
         self.storage_root = Path(storage_root)
         self.storage_root.mkdir(parents=True, exist_ok=True)
 
+        # Guards the cache and the dirty map
+        self._lock = threading.RLock()
+        # Serializes disk writes; taken before _lock, never while holding it
+        self._write_lock = threading.Lock()
+        self._cache: "OrderedDict[str, Job]" = OrderedDict()
+        # Job ID -> whether the pending write should be fsynced
+        self._dirty: Dict[str, bool] = {}
+        # Jobs taken from _dirty by a flush still writing them (not evictable)
+        self._flushing: Set[str] = set()
+        # Job ID -> compact JSON of the cached job, built on first read
+        self._json: Dict[str, bytes] = {}
+        # Job ID -> event set when the job is canceled (for in-flight jobs)
+        self._cancel_events: Dict[str, threading.Event] = {}
+
+        self._wakeup = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
     def _job_dir(self, job_id: str) -> Path:
         """Get job directory path."""
         return self.storage_root / job_id
@@ -28,11 +92,58 @@ class JobStore:
         """Get job metadata file path."""
         return self._job_dir(job_id) / "meta.json"
 
-    def save(self, job: Job) -> None:
+    @staticmethod
+    def _encode(job: Job) -> bytes:
+        """Encode job metadata for disk (lock held)."""
+        # orjson encodes the (slotted) dataclass and its str enum natively,
+        # producing the same document as job.to_dict()
+        return orjson.dumps(job, option=orjson.OPT_INDENT_2)
+
+    def _write(self, job_id: str, payload: bytes, durable: bool) -> None:
+        """Write encoded job metadata to disk atomically (temp file + rename).
+
+        Called with _write_lock held and _lock released.
+        """
+        meta_path = self._meta_path(job_id)
+        tmp_path = meta_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            if durable:
+                f.flush()
+                _datasync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+    def _write_through(self, job_id: str, payload: bytes, durable: bool) -> None:
+        """Write a job now (_write_lock held); on failure leave it to the flusher."""
+        try:
+            self._write(job_id, payload, durable)
+        except OSError:
+            with self._lock:
+                self._dirty[job_id] = True
+                self._wakeup.set()
+            raise
+
+    def _remember(self, job: Job) -> None:
+        """Put a job in the cache, evicting old clean entries (lock held)."""
+        self._cache[job.id] = job
+        self._cache.move_to_end(job.id)
+        if len(self._cache) > self.CACHE_SIZE:
+            for job_id in list(self._cache):
+                if len(self._cache) <= self.CACHE_SIZE:
+                    break
+                if job_id not in self._dirty and job_id not in self._flushing:
+                    del self._cache[job_id]
+                    self._json.pop(job_id, None)
+
+    def save(self, job: Job, durable: bool = True) -> None:
         """Save job metadata to disk.
 
+        The file is written to a temp file and renamed over meta.json, so
+        readers never see a partially written file.
+
         Args:
             job: Job instance to save
+            durable: fsync before the rename
         """
         job_dir = self._job_dir(job.id)
         job_dir.mkdir(parents=True, exist_ok=True)
@@ -41,12 +152,34 @@ class JobStore:
         (job_dir / "input").mkdir(exist_ok=True)
         (job_dir / "output").mkdir(exist_ok=True)
 
-        meta_path = self._meta_path(job.id)
-        with open(meta_path, 'w') as f:
-            json.dump(job.to_dict(), f, indent=2)
+        with self._write_lock:
+            with self._lock:
+                job = _copy_job(job)
+                payload = self._encode(job)
+                self._dirty.pop(job.id, None)
+                self._json.pop(job.id, None)
+                self._remember(job)
+            self._write_through(job.id, payload, durable)
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        """Return the cached job, loading it from disk if needed (lock held)."""
+        job = self._cache.get(job_id)
+        if job is not None:
+            self._cache.move_to_end(job_id)
+            return job
+
+        try:
+            with open(self._meta_path(job_id), 'rb') as f:
+                data = orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+        job = Job.from_dict(data)
+        self._remember(job)
+        return job
 
     def load(self, job_id: str) -> Optional[Job]:
-        """Load job metadata from disk.
+        """Load job metadata.
 
         Args:
             job_id: Job ID to load
@@ -54,18 +187,42 @@ class JobStore:
         Returns:
             Job instance or None if not found
         """
-        meta_path = self._meta_path(job_id)
-        if not meta_path.exists():
-            return None
+        with self._lock:
+            job = self._get(job_id)
+            # Hand out a copy so callers can't mutate the cached job
+            return _copy_job(job) if job is not None else None
+
+    def load_json(self, job_id: str) -> Optional[bytes]:
+        """Load job metadata as JSON, ready to send to a client.
 
-        with open(meta_path, 'r') as f:
-            data = json.load(f)
+        The encoded document is kept until the job next changes, so repeated
+        status polls neither decode nor re-encode anything.
 
-        return Job.from_dict(data)
+        Args:
+            job_id: Job ID to load
+
+        Returns:
+            JSON bytes (same shape as Job.to_dict()) or None if not found
+        """
+        with self._lock:
+            blob = self._json.get(job_id)
+            if blob is not None:
+                self._cache.move_to_end(job_id)
+                return blob
+
+            job = self._get(job_id)
+            if job is None:
+                return None
+            blob = self._json[job_id] = orjson.dumps(job)
+            return blob
 
     def update(self, job_id: str, **patch) -> Optional[Job]:
         """Update job fields idempotently.
 
+        The change is visible to load() immediately. It is written to disk
+        right away if the patch sets a terminal status, otherwise by the
+        background flusher.
+
         Args:
             job_id: Job ID to update
             **patch: Fields to update
@@ -73,21 +230,130 @@ class JobStore:
         Returns:
             Updated Job instance or None if not found
         """
-        job = self.load(job_id)
+        return self._apply(job_id, patch, durable=True)
+
+    def update_batched(self, job_id: str, **patch) -> None:
+        """Apply a non-critical update (e.g. progress).
+
+        Like update(), but the eventual write is not fsynced.
+
+        Args:
+            job_id: Job ID to update
+            **patch: Fields to update
+        """
+        self._apply(job_id, patch, durable=False)
+
+    def _apply(self, job_id: str, patch: dict, durable: bool) -> Optional[Job]:
+        """Patch the cached job and schedule (or perform) its write."""
+        if patch.get('status') in TERMINAL_STATUSES:
+            # Written straight through
+            with self._write_lock:
+                with self._lock:
+                    job = self._patch(job_id, patch)
+                    if job is None:
+                        return None
+                    payload = self._encode(job)
+                    self._dirty.pop(job_id, None)
+                    job = _copy_job(job)
+                self._write_through(job_id, payload, durable=True)
+                return job
+
+        with self._lock:
+            job = self._patch(job_id, patch)
+            if job is None:
+                return None
+            self._dirty[job_id] = self._dirty.get(job_id, False) or durable
+            self._wakeup.set()
+            return _copy_job(job)
+
+    def _patch(self, job_id: str, patch: dict) -> Optional[Job]:
+        """Apply a patch to the cached job (lock held)."""
+        job = self._get(job_id)
         if job is None:
             return None
 
         # Update fields
         for key, value in patch.items():
-            if hasattr(job, key):
+            if key in _JOB_FIELD_SET:
                 setattr(job, key, value)
 
         # Always update timestamp
         job.updated_at = Job.now()
+        self._json.pop(job_id, None)
+
+        if patch.get('status') == JobStatus.CANCELED:
+            self.cancel_event(job_id).set()
 
-        self.save(job)
         return job
 
+    def cancel_event(self, job_id: str) -> threading.Event:
+        """Get the event that is set when a job is canceled.
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            Event (created on first use)
+        """
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+            if event is None:
+                event = self._cancel_events[job_id] = threading.Event()
+            return event
+
+    def is_canceled(self, job_id: str) -> bool:
+        """Check whether a job has been canceled, without loading it."""
+        event = self._cancel_events.get(job_id)
+        return event is not None and event.is_set()
+
+    def forget_cancel(self, job_id: str) -> None:
+        """Drop a job's cancel event once nothing is waiting on it."""
+        with self._lock:
+            self._cancel_events.pop(job_id, None)
+
+    def flush(self) -> bool:
+        """Write all dirty jobs to disk now.
+
+        Returns:
+            False if some writes failed (those jobs stay dirty)
+        """
+        failed: Dict[str, bool] = {}
+        with self._write_lock:
+            # Encode a snapshot of the dirty jobs, then write it unlocked
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                self._flushing.update(dirty)
+                pending = [
+                    (job_id, self._encode(self._cache[job_id]), durable)
+                    for job_id, durable in dirty.items() if job_id in self._cache
+                ]
+
+            for job_id, payload, durable in pending:
+                try:
+                    self._write(job_id, payload, durable)
+                except OSError as e:
+                    print(f"[JobStore] Failed to write job {job_id}: {e}", flush=True)
+                    failed[job_id] = durable
+
+            with self._lock:
+                self._flushing.clear()
+                # Retry failed writes (merged with any newer changes)
+                for job_id, durable in failed.items():
+                    self._dirty[job_id] = self._dirty.get(job_id, False) or durable
+        return not failed
+
+    def _flush_loop(self) -> None:
+        """Background flusher: write dirty jobs at most every FLUSH_INTERVAL."""
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if not self.flush():
+                # Retry later (the failed jobs are dirty again)
+                self._wakeup.set()
+                time.sleep(self.RETRY_INTERVAL)
+            # Let more updates accumulate before the next batch
+            time.sleep(self.FLUSH_INTERVAL)
+
     def get_input_dir(self, job_id: str) -> Path:
         """Get input directory for job."""
         return self._job_dir(job_id) / "input"
@@ -98,4 +364,7 @@ class JobStore:
 
     def exists(self, job_id: str) -> bool:
         """Check if job exists."""
+        with self._lock:
+            if job_id in self._cache:
+                return True
         return self._meta_path(job_id).exists()
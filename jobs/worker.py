@@ -1,22 +1,55 @@
 #!/usr/bin/env python3
 """Background job worker thread."""
 
+import orjson
+import shutil
 import threading
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-from typing import Optional, Callable
+from typing import List, Optional, Callable
 
-from .models import Job, JobStatus
+from .models import Job, JobStatus, find_media_files
 from .queue import JobQueue
 from .store import JobStore
-from comfy.client import ComfyUIClient
+from comfy.client import ComfyUIClient, WS_ERRORS, websocket
 from comfy.workflow import load_base, apply_overrides, apply_song_overrides
 
 
+# Song workflow used when the worker is not given one
+DEFAULT_SONG_WORKFLOW_PATH = Path("/home/karol/ComfyUI/user/default/workflows/song-api.json")
+
+
+def _close_events(future) -> None:
+    """Close an event socket opened by a future that is no longer needed."""
+    ws = future.result()
+    if ws is not None:
+        ws.close()
+
+
 class JobWorker:
     """Background worker for processing jobs."""
 
+    # Seconds without an event before the ComfyUI socket is considered stalled
+    WS_SILENCE_TIMEOUT = 30.0
+
+    # Longest single wait for an event frame, so cancellation is noticed
+    # promptly even while the socket is quiet
+    WS_RECV_TIMEOUT = 1.0
+
+    # History polling interval bounds, in seconds (doubles while waiting)
+    MIN_POLL_INTERVAL = 0.5
+    MAX_POLL_INTERVAL = 5.0
+
+    # Copy buffer for input image downloads
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+    # Parallel output downloads per job (matches the ComfyUI connection pool)
+    DOWNLOAD_WORKERS = 4
+
     def __init__(
         self,
         queue: JobQueue,
@@ -24,7 +57,10 @@ class JobWorker:
         comfy_client: ComfyUIClient,
         workflow_path: Path,
         telegram_send_func: Optional[Callable[[Job], None]] = None,
-        timeout_minutes: int = 10
+        timeout_minutes: int = 10,
+        shard_id: int = 0,
+        song_workflow_path: Optional[Path] = None,
+        concurrency: int = 1
     ):
         """Initialize job worker.
 
@@ -35,46 +71,94 @@ class JobWorker:
             workflow_path: Path to base workflow JSON
             telegram_send_func: Optional function to send Telegram notifications
             timeout_minutes: Job timeout in minutes
+            shard_id: Queue shard this worker takes from first (one per worker)
+            song_workflow_path: Path to the song workflow JSON template
+            concurrency: Number of jobs processed at once (one thread each;
+                thread i starts from shard shard_id + i)
         """
         self.queue = queue
         self.store = store
         self.comfy_client = comfy_client
         self.workflow_path = workflow_path
+        self.base_workflow = load_base(workflow_path)
+        self.song_workflow_path = song_workflow_path or DEFAULT_SONG_WORKFLOW_PATH
         self.telegram_send_func = telegram_send_func
         self.timeout_seconds = timeout_minutes * 60
+        self.shard_id = shard_id
+        self.concurrency = max(1, concurrency)
         self.running = False
-        self.thread: Optional[threading.Thread] = None
-
-        # Stats
+        self.threads: List[threading.Thread] = []
+
+        # Input downloads and webhooks reuse connections per host; gateway
+        # errors on GETs are retried (webhook POSTs are not re-sent)
+        self.http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=4 * self.concurrency,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+
+        # Blocking I/O that can overlap within a job (output downloads)
+        self._io_pool = ThreadPoolExecutor(
+            max_workers=self.DOWNLOAD_WORKERS * self.concurrency,
+            thread_name_prefix="job-io"
+        )
+
+        # Stats (shared by the worker threads)
         self.stats = {
             "success": 0,
             "failed": 0,
             "timed_out": 0,
             "canceled": 0
         }
+        self._stats_lock = threading.Lock()
 
     def start(self):
-        """Start worker thread."""
+        """Start worker threads."""
         if self.running:
             return
 
         self.running = True
-        self.thread = threading.Thread(target=self._worker_loop, daemon=True)
-        self.thread.start()
-        print("[JobWorker] Worker thread started")
+        self.threads = [
+            threading.Thread(target=self._worker_loop, args=(self.shard_id + i,), daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in self.threads:
+            thread.start()
+        print(f"[JobWorker] {len(self.threads)} worker thread(s) started")
 
     def stop(self):
-        """Stop worker thread."""
+        """Stop worker threads."""
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5)
-        print("[JobWorker] Worker thread stopped")
+        for thread in self.threads:
+            thread.join(timeout=5)
+        print("[JobWorker] Worker threads stopped")
+
+    def _count(self, outcome: str):
+        """Increment an outcome counter in stats."""
+        with self._stats_lock:
+            self.stats[outcome] += 1
+
+    def reload_workflow(self):
+        """Re-read the base workflow template from disk.
 
-    def _worker_loop(self):
-        """Main worker loop."""
+        Jobs that start after this call use the new template; a job already
+        in progress keeps the one it started with.
+        """
+        self.base_workflow = load_base(self.workflow_path)
+        print(f"[JobWorker] Reloaded workflow from {self.workflow_path}")
+
+    def _worker_loop(self, shard_id: int):
+        """Main worker loop.
+
+        Args:
+            shard_id: Queue shard to take from first
+        """
         while self.running:
             # Dequeue job with timeout
-            job = self.queue.dequeue(timeout=1.0)
+            job = self.queue.dequeue(timeout=1.0, shard_id=shard_id)
             if job is None:
                 continue
 
@@ -89,7 +173,7 @@ class JobWorker:
                     status=JobStatus.FAILED,
                     error=f"Unexpected error: {str(e)}"
                 )
-                self.stats["failed"] += 1
+                self._count("failed")
 
     def _process_job(self, job: Job):
         """Process a single job.
@@ -99,44 +183,47 @@ class JobWorker:
         """
         start_time = time.time()
 
-        # Check if canceled
-        if job.status == JobStatus.CANCELED:
+        # Check if canceled (possibly while it was waiting in the queue)
+        if job.status == JobStatus.CANCELED or self.store.is_canceled(job.id):
             print(f"[JobWorker] Job {job.id} was canceled")
-            self.stats["canceled"] += 1
+            self.store.forget_cancel(job.id)
+            self._count("canceled")
             return
 
         # Update to running
         self.store.update(job.id, status=JobStatus.RUNNING, progress=10)
 
+        # Connect the event socket in the background while the input is
+        # downloaded and uploaded (the job ID doubles as the ComfyUI client ID)
+        events = self._io_pool.submit(self._open_events, job.id)
+
         try:
             params = job.params or {}
             workflow_type = params.get("workflow_type", "im2vid")
 
             # Handle song workflow
             if workflow_type == "song":
-                # Song workflow - no image needed
-                song_workflow_path = Path("/home/karol/ComfyUI/user/default/workflows/song-api.json")
-                base_workflow = load_base(song_workflow_path)
+                # Song workflow - no image needed. load_base only stats the
+                # file (edits are picked up) and the parsed template is cached.
                 workflow = apply_song_overrides(
-                    base_workflow,
+                    load_base(self.song_workflow_path),
                     description=params.get("song_description", ""),
                     lyrics=params.get("song_lyrics", "")
                 )
-                self.store.update(job.id, progress=40)
+                self.store.update_batched(job.id, progress=40)
             else:
                 # Image-to-video workflow
                 # Step 1: Download input image
                 input_path = self._stage_input(job)
-                self.store.update(job.id, progress=20)
+                self.store.update_batched(job.id, progress=20)
 
                 # Step 2: Upload to ComfyUI (if needed)
                 uploaded_filename = self.comfy_client.upload_image(input_path)
-                self.store.update(job.id, progress=30)
+                self.store.update_batched(job.id, progress=30)
 
                 # Step 3: Build workflow
-                base_workflow = load_base(self.workflow_path)
                 workflow = apply_overrides(
-                    base_workflow,
+                    self.base_workflow,
                     prompt=job.prompt,
                     seed=params.get("seed"),
                     duration_seconds=params.get("duration_seconds"),
@@ -144,29 +231,39 @@ class JobWorker:
                     resolution=params.get("resolution"),
                     input_filename=uploaded_filename
                 )
-                self.store.update(job.id, progress=40)
+                self.store.update_batched(job.id, progress=40)
 
-            # Step 4: Queue prompt
-            prompt_id = self.comfy_client.queue_prompt(workflow)
+            # Step 4: Queue prompt (once subscribed to its events, so none
+            # are missed)
+            ws, events = events.result(), None
+            try:
+                prompt_id = self.comfy_client.queue_prompt(workflow, client_id=job.id)
+            except BaseException:
+                if ws is not None:
+                    ws.close()
+                raise
             self.store.update(job.id, prompt_id=prompt_id, progress=50)
             print(f"[JobWorker] Job {job.id} queued as prompt {prompt_id}")
 
-            # Step 5: Poll for completion
-            outputs = self._poll_for_outputs(job, prompt_id, start_time)
-            self.store.update(job.id, progress=80)
+            # Step 5: Wait for completion
+            outputs = self._poll_for_outputs(job, prompt_id, start_time, ws)
+            self.store.update_batched(job.id, progress=80)
 
             # Step 6: Download outputs
             output_files = self._download_outputs(job, outputs)
-            self.store.update(job.id, progress=90)
+            self.store.update_batched(job.id, progress=90)
 
             # Step 7: Mark complete
+            video_file, audio_file = find_media_files(output_files)
             self.store.update(
                 job.id,
                 status=JobStatus.COMPLETED,
                 progress=100,
-                files=output_files
+                files=output_files,
+                video_file=video_file,
+                audio_file=audio_file
             )
-            self.stats["success"] += 1
+            self._count("success")
             print(f"[JobWorker] Job {job.id} completed with {len(output_files)} files")
 
             # Step 8: Send to Telegram if configured
@@ -189,7 +286,7 @@ class JobWorker:
                 status=JobStatus.TIMED_OUT,
                 error=str(e)
             )
-            self.stats["timed_out"] += 1
+            self._count("timed_out")
 
         except Exception as e:
             print(f"[JobWorker] Job {job.id} failed: {e}")
@@ -198,7 +295,13 @@ class JobWorker:
                 status=JobStatus.FAILED,
                 error=str(e)
             )
-            self.stats["failed"] += 1
+            self._count("failed")
+
+        finally:
+            if events is not None:
+                # Failed before the prompt was queued; close the socket once open
+                events.add_done_callback(_close_events)
+            self.store.forget_cancel(job.id)
 
     def _stage_input(self, job: Job) -> Path:
         """Download and stage input image.
@@ -224,23 +327,111 @@ class JobWorker:
         # Download from URL
         input_path = input_dir / "input.png"
         if not input_path.exists():
-            response = requests.get(job.input_image_url, stream=True, timeout=60)
+            response = self.http.get(job.input_image_url, stream=True, timeout=60)
             response.raise_for_status()
 
-            with open(input_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            response.raw.decode_content = True
+            try:
+                with open(input_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, self.DOWNLOAD_CHUNK_SIZE)
+            finally:
+                response.close()
 
         return input_path
 
-    def _poll_for_outputs(self, job: Job, prompt_id: str, start_time: float) -> dict:
-        """Poll ComfyUI for output files.
+    def _open_events(self, client_id: str):
+        """Open the ComfyUI event socket, or return None to use polling."""
+        if websocket is None:
+            return None
+        try:
+            return self.comfy_client.connect_ws(client_id)
+        except WS_ERRORS as e:
+            print(f"[JobWorker] Event socket unavailable, polling instead: {e}")
+            return None
+
+    def _wait_for_events(self, ws, job: Job, prompt_id: str, start_time: float):
+        """Block on ComfyUI events until the prompt finishes.
+
+        Progress frames update the job. Cancellation is checked at least
+        every WS_RECV_TIMEOUT. After WS_SILENCE_TIMEOUT without a frame,
+        history is checked once (the finish event may have been lost) and
+        the socket is reopened.
+
+        Args:
+            ws: Connected event socket (closed before returning)
+            job: Job instance
+            prompt_id: ComfyUI prompt ID
+            start_time: Job start timestamp
+
+        Raises:
+            TimeoutError: If job times out
+            Exception: On ComfyUI error or cancellation
+            WS_ERRORS: If the socket fails (caller falls back to polling)
+        """
+        try:
+            last_frame = time.time()
+            while True:
+                remaining = self.timeout_seconds - (time.time() - start_time)
+                if remaining <= 0:
+                    raise TimeoutError(f"Job timed out after {time.time() - start_time:.1f}s")
+
+                if self.store.is_canceled(job.id):
+                    raise Exception("Job was canceled")
+
+                silent = time.time() - last_frame
+                if silent >= self.WS_SILENCE_TIMEOUT:
+                    if prompt_id in self.comfy_client.get_history(prompt_id):
+                        return
+                    print(f"[JobWorker] Event socket silent for {self.WS_SILENCE_TIMEOUT:.0f}s, reconnecting")
+                    ws.close()
+                    ws = self.comfy_client.connect_ws(job.id)
+                    last_frame = time.time()
+                    continue
+
+                ws.settimeout(min(remaining, self.WS_SILENCE_TIMEOUT - silent, self.WS_RECV_TIMEOUT))
+                try:
+                    frame = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    continue
+                last_frame = time.time()
+
+                # Binary frames are live previews
+                if not isinstance(frame, str):
+                    continue
+
+                msg = orjson.loads(frame)
+                data = msg.get("data") or {}
+                if data.get("prompt_id") != prompt_id:
+                    continue
+
+                msg_type = msg.get("type")
+                if msg_type == "progress" and data.get("max"):
+                    # Sampling maps onto the 50-80% band
+                    progress = 50 + int(30 * data["value"] / data["max"])
+                    self.store.update_batched(job.id, progress=progress)
+                elif msg_type == "execution_success":
+                    return
+                elif msg_type == "executing" and data.get("node") is None:
+                    # Older ComfyUI signals completion this way
+                    return
+                elif msg_type == "execution_error":
+                    raise Exception(f"ComfyUI error: {data.get('exception_message', 'Unknown error')}")
+                elif msg_type == "execution_interrupted":
+                    raise Exception("ComfyUI execution was interrupted")
+        finally:
+            ws.close()
+
+    def _poll_for_outputs(self, job: Job, prompt_id: str, start_time: float, ws=None) -> dict:
+        """Wait for ComfyUI to finish the prompt and return its outputs.
+
+        With an event socket, waits for the finish event instead of polling;
+        if the socket fails, falls back to polling /history.
 
         Args:
             job: Job instance
             prompt_id: ComfyUI prompt ID
             start_time: Job start timestamp
+            ws: Optional event socket opened before the prompt was queued
 
         Returns:
             Outputs dict from history
@@ -249,7 +440,14 @@ class JobWorker:
             TimeoutError: If job times out
             Exception: On other errors
         """
-        poll_interval = 2.0
+        if ws is not None:
+            try:
+                self._wait_for_events(ws, job, prompt_id, start_time)
+            except WS_ERRORS as e:
+                print(f"[JobWorker] Event socket failed, polling instead: {e}")
+
+        cancel_event = self.store.cancel_event(job.id)
+        poll_interval = self.MIN_POLL_INTERVAL
 
         while True:
             # Check timeout
@@ -258,8 +456,7 @@ class JobWorker:
                 raise TimeoutError(f"Job timed out after {elapsed:.1f}s")
 
             # Check if canceled
-            current_job = self.store.load(job.id)
-            if current_job and current_job.status == JobStatus.CANCELED:
+            if cancel_event.is_set():
                 raise Exception("Job was canceled")
 
             # Get history
@@ -267,28 +464,27 @@ class JobWorker:
                 history = self.comfy_client.get_history(prompt_id)
             except Exception as e:
                 print(f"[JobWorker] Error fetching history: {e}")
-                time.sleep(poll_interval)
-                continue
+                history = {}
 
             # Check if prompt is in history
-            if prompt_id not in history:
-                time.sleep(poll_interval)
-                continue
-
-            prompt_data = history[prompt_id]
-
-            # Check for errors
-            if 'status' in prompt_data and prompt_data['status'].get('status_str') == 'error':
-                error_msg = prompt_data['status'].get('messages', ['Unknown error'])[0]
-                raise Exception(f"ComfyUI error: {error_msg}")
-
-            # Check for outputs
-            outputs = prompt_data.get('outputs', {})
-            if outputs:
-                print(f"[JobWorker] Found outputs for prompt {prompt_id}")
-                return outputs
-
-            time.sleep(poll_interval)
+            prompt_data = history.get(prompt_id)
+            if prompt_data is not None:
+                # Check for errors
+                if 'status' in prompt_data and prompt_data['status'].get('status_str') == 'error':
+                    error_msg = prompt_data['status'].get('messages', ['Unknown error'])[0]
+                    raise Exception(f"ComfyUI error: {error_msg}")
+
+                # Check for outputs
+                outputs = prompt_data.get('outputs', {})
+                if outputs:
+                    print(f"[JobWorker] Found outputs for prompt {prompt_id}")
+                    return outputs
+
+            # Poll quickly at first and back off for long runs; a cancel
+            # ends the wait immediately
+            if cancel_event.wait(poll_interval):
+                raise Exception("Job was canceled")
+            poll_interval = min(poll_interval * 2, self.MAX_POLL_INTERVAL)
 
     def _download_outputs(self, job: Job, outputs: dict) -> list:
         """Download output files from ComfyUI.
@@ -301,7 +497,7 @@ class JobWorker:
             List of output filenames
         """
         output_dir = self.store.get_output_dir(job.id)
-        downloaded = []
+        downloads = {}
 
         for node_id, node_output in outputs.items():
             # Look for videos, images, or audio
@@ -309,22 +505,23 @@ class JobWorker:
                 if output_type in node_output:
                     for file_info in node_output[output_type]:
                         filename = file_info.get('filename')
-                        subfolder = file_info.get('subfolder', '')
-                        ftype = file_info.get('type', 'output')
 
-                        if filename:
-                            dest_path = output_dir / filename
+                        # Each file is fetched once (and never written concurrently)
+                        if filename and filename not in downloads:
                             print(f"[JobWorker] Downloading {filename}...")
-
-                            self.comfy_client.download_output(
+                            downloads[filename] = self._io_pool.submit(
+                                self.comfy_client.download_output,
                                 filename=filename,
-                                dest_path=dest_path,
-                                subfolder=subfolder,
-                                ftype=ftype
+                                dest_path=output_dir / filename,
+                                subfolder=file_info.get('subfolder', ''),
+                                ftype=file_info.get('type', 'output')
                             )
-                            downloaded.append(filename)
 
-        return downloaded
+        # Wait for all of them; the first failure fails the job
+        for future in downloads.values():
+            future.result()
+
+        return list(downloads)
 
     def _call_webhook(self, job: Job):
         """Call webhook URL with job result.
@@ -344,9 +541,10 @@ class JobWorker:
                 "error": updated_job.error
             }
 
-            response = requests.post(
+            response = self.http.post(
                 job.webhook_url,
-                json=payload,
+                data=orjson.dumps(payload),
+                headers={'Content-Type': 'application/json'},
                 timeout=10
             )
             response.raise_for_status()
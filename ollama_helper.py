@@ -1,13 +1,25 @@
 #!/usr/bin/env python3
 """Ollama helper for AI-assisted content generation."""
 
+import orjson
+import socket
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional
 
 
 class OllamaHelper:
     """Helper for generating content with Ollama."""
 
+    # How long a connection test result is reused, in seconds
+    CONNECTION_TTL = 5.0
+
+    # Read size for streamed generate responses
+    STREAM_CHUNK_SIZE = 64 * 1024
+
     def __init__(self, base_url: str = "http://127.0.0.1:11434"):
         """Initialize Ollama helper.
 
@@ -16,19 +28,40 @@ class OllamaHelper:
         """
         self.base_url = base_url
 
+        # Keep-alive connections to the local Ollama server; gateway errors
+        # on idempotent requests are retried
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=4,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Last connection test: (monotonic time, reachable)
+        self._conn_cache: Optional[tuple] = None
+        self._conn_lock = threading.Lock()
+
     def generate_song(
         self,
         user_prompt: str,
-        model: str = "qwen2.5:7b"
+        model: str = "qwen2.5:7b",
+        deadline: Optional[float] = None
     ) -> Optional[tuple[str, str]]:
         """Generate song description and lyrics using Ollama.
 
         Args:
             user_prompt: User's creative prompt for the song
             model: Ollama model to use
+            deadline: Total time allowed, in seconds (None = only the
+                per-read timeout applies)
 
         Returns:
             Tuple of (description, lyrics) or None on error
+
+        Raises:
+            TimeoutError: The deadline passed before Ollama finished
         """
         system_prompt = """You are a creative songwriter. When given a prompt, generate:
 1. A detailed musical description (genre, style, instruments, mood, tempo)
@@ -43,24 +76,49 @@ Be creative but keep descriptions concise. Lyrics should be 8-16 lines."""
 
         full_prompt = f"{system_prompt}\n\nUser prompt: {user_prompt}\n\nGenerate the song:"
 
+        start = time.monotonic()
+        expired = threading.Event()
+        timer = None
         try:
-            response = requests.post(
+            # Stream tokens: the timeout then bounds the gap between chunks
+            # rather than the whole generation (the deadline bounds that)
+            response = self.session.post(
                 f"{self.base_url}/api/generate",
-                json={
+                data=orjson.dumps({
                     "model": model,
                     "prompt": full_prompt,
-                    "stream": False,
+                    "stream": True,
                     "options": {
                         "temperature": 0.8,
                         "top_p": 0.9,
                     }
-                },
-                timeout=120
+                }),
+                headers={'Content-Type': 'application/json'},
+                stream=True,
+                timeout=120 if deadline is None else min(120, deadline)
             )
             response.raise_for_status()
 
-            result = response.json()
-            generated = result.get("response", "")
+            if deadline is not None:
+                remaining = max(0.0, deadline - (time.monotonic() - start))
+                timer = threading.Timer(remaining, self._abort_stream, (response, expired))
+                timer.daemon = True
+                timer.start()
+
+            # One JSON object per line; the lyrics are the tail of the text,
+            # so read until Ollama reports done
+            fragments = []
+            with response:
+                for line in response.iter_lines(chunk_size=self.STREAM_CHUNK_SIZE):
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    fragments.append(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        break
+            if expired.is_set():
+                raise TimeoutError("stream cut off at the deadline")
+            generated = "".join(fragments)
 
             # Parse the response
             if "DESCRIPTION:" in generated and "LYRICS:" in generated:
@@ -73,17 +131,48 @@ Be creative but keep descriptions concise. Lyrics should be 8-16 lines."""
             return None
 
         except Exception as e:
+            if expired.is_set():
+                raise TimeoutError(f"Song generation exceeded {deadline}s") from e
             print(f"[OllamaHelper] Error generating song: {e}")
             return None
 
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    @staticmethod
+    def _abort_stream(response: requests.Response, expired: threading.Event) -> None:
+        """Cut off a streamed response that is being read by another thread.
+
+        Shutting the socket down wakes the reader's blocked recv(); its
+        `with response:` block then closes the response.
+        """
+        expired.set()
+        sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
     def test_connection(self) -> bool:
         """Test if Ollama is reachable.
 
+        The result is reused for CONNECTION_TTL seconds, so frequent callers
+        share one /api/tags request.
+
         Returns:
             True if Ollama is accessible
         """
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
-        except Exception:
-            return False
+        with self._conn_lock:
+            if self._conn_cache and time.monotonic() - self._conn_cache[0] < self.CONNECTION_TTL:
+                return self._conn_cache[1]
+
+            try:
+                response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+
+            self._conn_cache = (time.monotonic(), ok)
+            return ok
@@ -1,10 +1,110 @@
 #!/usr/bin/env python3
 """Telegram Bot API client."""
 
+import contextlib
+import io
+import mimetypes
+import orjson
+import os
+import socket
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 from pathlib import Path
 from typing import Optional
 
+from cache import ttl_cache
+
+# Optional: stream multipart uploads from disk instead of building them in memory
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+
+# How long getFile results are reused; Telegram guarantees download links
+# for at least an hour
+_FILE_INFO_TTL = 50 * 60
+
+# Request bodies are encoded with orjson, so the content type is set by hand
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Backslash-escapes for the characters with meaning in (legacy) Markdown
+# messages; str.translate applies them in one C-level pass
+_MARKDOWN_ESCAPES = str.maketrans({c: '\\' + c for c in '_*`['})
+
+
+def escape_markdown(text: str) -> str:
+    """Escape text for interpolation into a Markdown message.
+
+    Unescaped user text (prompts, error strings) can leave an entity
+    unclosed, and Telegram then rejects the whole message.
+
+    Args:
+        text: Raw text
+
+    Returns:
+        Escaped text
+    """
+    return text.translate(_MARKDOWN_ESCAPES)
+
+
+def _advise_sequential(fd: int) -> None:
+    """Tell the kernel a file will be read front to back (larger read-ahead)."""
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except (OSError, AttributeError):
+        pass
+
+
+class _RateLimiter:
+    """Thread-safe token bucket: at most ``rate`` calls per second on average."""
+
+    def __init__(self, rate: float, burst: int):
+        """Initialize limiter.
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket size (calls allowed back to back)
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until it is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            # Reserve the token even if it goes negative; later callers queue
+            # up behind it
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets send TCP keepalives while idle.
+
+    Sends come in bursts (status, then media) with idle gaps between jobs;
+    keepalives stop NAT/firewall state from expiring in those gaps, so the
+    next burst reuses the open TLS connection instead of handshaking again.
+    """
+
+    SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ] + ([(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)] if hasattr(socket, 'TCP_KEEPIDLE') else [])
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
 
 class TelegramAPI:
     """Minimal Telegram Bot API client."""
@@ -12,6 +112,32 @@ class TelegramAPI:
     # Telegram file size limit: 50MB
     MAX_FILE_SIZE = 50 * 1024 * 1024
 
+    # Copy buffer for file downloads
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+    # Read buffer for file uploads (the encoder pulls small blocks per send)
+    UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+    # Bot API limit for outgoing messages, per bot (messages per second)
+    SEND_RATE = 30
+
+    # 429 handling: how often to wait out Retry-After, and the longest wait
+    # worth blocking for (longer flood bans are returned to the caller)
+    MAX_RATE_LIMIT_RETRIES = 3
+    MAX_RETRY_AFTER = 30
+
+    # Update types the bot handles; Telegram drops the rest server-side
+    ALLOWED_UPDATES = ["message"]
+
+    # getUpdates batch size (Bot API maximum) and connect timeout, in seconds
+    UPDATES_LIMIT = 100
+    CONNECT_TIMEOUT = 5
+
+    # Pooled connections: the long poll, 4 update handler threads (poller or
+    # webhook), 2 Docket status senders and the job workers' notifications.
+    # Threads beyond this still work but open throwaway connections.
+    POOL_MAXSIZE = 12
+
     def __init__(self, bot_token: str):
         """Initialize Telegram API client.
 
@@ -20,14 +146,83 @@ class TelegramAPI:
         """
         self.bot_token = bot_token
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
+
+        # One keep-alive pool for api.telegram.org: the long-poll holds one
+        # connection while the update handlers and job notifications send
+        # and download on the others. Retry covers dropped connections
+        # and 5xx on GETs; POSTs are not re-sent after a read error or 5xx,
+        # since the message may already have been delivered. Retry-After is
+        # ignored here so 429s reach _request, which caps the wait at
+        # MAX_RETRY_AFTER.
         self.session = requests.Session()
+        self.session.mount('https://', _KeepAliveAdapter(
+            pool_connections=1,
+            pool_maxsize=self.POOL_MAXSIZE,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[500, 502, 503, 504],
+                respect_retry_after_header=False
+            )
+        ))
+
+        # Every send* call takes a token, so bursts stay under SEND_RATE
+        # instead of drawing 429s
+        self._send_limiter = _RateLimiter(self.SEND_RATE, self.SEND_RATE)
+
+        # getFile results, cached per client so the cache (and nothing else)
+        # goes away with a replaced client
+        self._cached_file_info = ttl_cache(ttl=_FILE_INFO_TTL, maxsize=1024)(self._fetch_file_info)
+
+    def _retry_delay(self, response: requests.Response) -> Optional[float]:
+        """Seconds to wait before retrying a 429 response, or None to give up."""
+        if response.status_code != 429:
+            return None
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None:
+            try:
+                retry_after = orjson.loads(response.content)['parameters']['retry_after']
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                retry_after = 1
+        try:
+            retry_after = float(retry_after)
+        except ValueError:
+            return None
+        return retry_after if retry_after <= self.MAX_RETRY_AFTER else None
 
-    def send_message(self, chat_id: str, text: str) -> dict:
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a Bot API request, waiting out 429 Too Many Requests.
+
+        Telegram says how long to back off (Retry-After, or
+        parameters.retry_after in the body); the request is repeated after
+        that delay up to MAX_RATE_LIMIT_RETRIES times. Other errors are left
+        to the caller (and the adapter's Retry).
+
+        Args:
+            method: HTTP method
+            url: Request URL
+            **kwargs: Passed to Session.request
+
+        Returns:
+            HTTP response (possibly still a 429)
+        """
+        for _ in range(self.MAX_RATE_LIMIT_RETRIES):
+            response = self.session.request(method, url, **kwargs)
+            delay = self._retry_delay(response)
+            if delay is None:
+                return response
+            response.close()
+            print(f"[TelegramAPI] Rate limited, retrying in {delay:.0f}s", flush=True)
+            time.sleep(delay + 0.1)
+        return self.session.request(method, url, **kwargs)
+
+    def send_message(self, chat_id: str, text: str, parse_mode: Optional[str] = "Markdown") -> dict:
         """Send text message.
 
         Args:
             chat_id: Chat ID to send to
             text: Message text
+            parse_mode: Telegram parse mode, or None for plain text
 
         Returns:
             API response dict
@@ -38,15 +233,51 @@ class TelegramAPI:
         url = f"{self.base_url}/sendMessage"
         payload = {
             "chat_id": chat_id,
-            "text": text,
-            "parse_mode": "Markdown"
+            "text": text
+        }
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        self._send_limiter.acquire()
+        response = self._request('POST', url, data=orjson.dumps(payload), headers=_JSON_HEADERS, timeout=10)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    def edit_message_text(
+        self,
+        chat_id: str,
+        message_id: int,
+        text: str,
+        parse_mode: Optional[str] = "Markdown"
+    ) -> dict:
+        """Replace the text of a message sent earlier.
+
+        Args:
+            chat_id: Chat ID
+            message_id: ID of the message to edit
+            text: New message text
+            parse_mode: Telegram parse mode, or None for plain text
+
+        Returns:
+            API response dict
+
+        Raises:
+            requests.RequestException: On API error
+        """
+        url = f"{self.base_url}/editMessageText"
+        payload = {
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "text": text
         }
-        response = self.session.post(url, json=payload, timeout=10)
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        self._send_limiter.acquire()
+        response = self._request('POST', url, data=orjson.dumps(payload), headers=_JSON_HEADERS, timeout=10)
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
     def send_status(self, chat_id: str, text: str) -> dict:
-        """Send status update message.
+        """Send status update message (as plain text).
 
         Args:
             chat_id: Chat ID
@@ -55,7 +286,65 @@ class TelegramAPI:
         Returns:
             API response dict
         """
-        return self.send_message(chat_id, text)
+        return self.send_message(chat_id, text, parse_mode=None)
+
+    def _post_file(
+        self,
+        url: str,
+        field: str,
+        file_path: Path,
+        data: dict,
+        timeout: int = 300,
+        filename: Optional[str] = None
+    ) -> requests.Response:
+        """POST a file as multipart/form-data.
+
+        With requests_toolbelt installed the body is streamed from disk as it
+        is sent; otherwise requests assembles the whole body in memory first.
+
+        Args:
+            url: API method URL
+            field: Form field name for the file
+            file_path: Path to the file, or a seekable binary file object
+                (sent from its start; left open)
+            data: Other form fields
+            timeout: Request timeout in seconds
+            filename: Filename shown to the recipient (default: file name)
+
+        Returns:
+            HTTP response
+        """
+        filename = filename or Path(getattr(file_path, 'name', 'file')).name
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        # The body is consumed by each attempt, so 429 retries reopen (or
+        # rewind) the file
+        for attempt in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            self._send_limiter.acquire()
+            if hasattr(file_path, 'read'):
+                file_path.seek(0)
+                upload = contextlib.nullcontext(file_path)
+            else:
+                upload = open(file_path, 'rb', buffering=self.UPLOAD_BUFFER_SIZE)
+                _advise_sequential(upload.fileno())
+            with upload as f:
+                if MultipartEncoder is None:
+                    response = self.session.post(
+                        url, data=data, files={field: (filename, f, mimetype)}, timeout=timeout
+                    )
+                else:
+                    fields = {key: str(value) for key, value in data.items()}
+                    fields[field] = (filename, f, mimetype)
+                    body = MultipartEncoder(fields=fields)
+                    response = self.session.post(
+                        url, data=body, headers={'Content-Type': body.content_type}, timeout=timeout
+                    )
+
+            delay = self._retry_delay(response)
+            if delay is None or attempt == self.MAX_RATE_LIMIT_RETRIES:
+                return response
+            print(f"[TelegramAPI] Rate limited, retrying upload in {delay:.0f}s", flush=True)
+            time.sleep(delay + 0.1)
 
     def send_video(
         self,
@@ -83,7 +372,7 @@ class TelegramAPI:
         # If file too large, send link instead
         if file_size > self.MAX_FILE_SIZE:
             if link_fallback:
-                msg = f"🎥 Video ready!\n\n{caption or ''}\n\n[Download]({link_fallback})"
+                msg = f"🎥 Video ready!\n\n{escape_markdown(caption or '')}\n\n[Download]({link_fallback})"
                 return self.send_message(chat_id, msg)
             else:
                 msg = f"⚠️ Video is too large ({file_size / 1024 / 1024:.1f}MB) to send directly."
@@ -91,15 +380,13 @@ class TelegramAPI:
 
         # Send video file
         url = f"{self.base_url}/sendVideo"
-        with open(file_path, 'rb') as f:
-            files = {'video': f}
-            data = {'chat_id': chat_id}
-            if caption:
-                data['caption'] = caption
+        data = {'chat_id': chat_id}
+        if caption:
+            data['caption'] = caption
 
-            response = self.session.post(url, data=data, files=files, timeout=300)
-            response.raise_for_status()
-            return response.json()
+        response = self._post_file(url, 'video', file_path, data)
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     def send_audio(
         self,
@@ -127,7 +414,7 @@ class TelegramAPI:
         # If file too large, send link instead
         if file_size > self.MAX_FILE_SIZE:
             if link_fallback:
-                msg = f"🎵 Audio ready!\n\n{caption or ''}\n\n[Download]({link_fallback})"
+                msg = f"🎵 Audio ready!\n\n{escape_markdown(caption or '')}\n\n[Download]({link_fallback})"
                 return self.send_message(chat_id, msg)
             else:
                 msg = f"⚠️ Audio is too large ({file_size / 1024 / 1024:.1f}MB) to send directly."
@@ -135,19 +422,33 @@ class TelegramAPI:
 
         # Send audio file
         url = f"{self.base_url}/sendAudio"
-        with open(file_path, 'rb') as f:
-            files = {'audio': f}
-            data = {'chat_id': chat_id}
-            if caption:
-                data['caption'] = caption
+        data = {'chat_id': chat_id}
+        if caption:
+            data['caption'] = caption
+
+        response = self._post_file(url, 'audio', file_path, data)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    def get_me(self) -> dict:
+        """Get basic information about the bot (connection test).
 
-            response = self.session.post(url, data=data, files=files, timeout=300)
-            response.raise_for_status()
-            return response.json()
+        Returns:
+            API response dict
+
+        Raises:
+            requests.RequestException: On API error
+        """
+        response = self._request('GET', f"{self.base_url}/getMe", timeout=10)
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     def get_file(self, file_id: str) -> dict:
         """Get file info.
 
+        Results are cached for a while, so handling the same attachment
+        again skips the getFile round trip.
+
         Args:
             file_id: Telegram file ID
 
@@ -157,10 +458,16 @@ class TelegramAPI:
         Raises:
             requests.RequestException: On API error
         """
+        return self._cached_file_info(file_id)
+
+    def _fetch_file_info(self, file_id: str) -> dict:
+        """Call getFile (uncached)."""
         url = f"{self.base_url}/getFile"
-        response = self.session.post(url, json={"file_id": file_id}, timeout=10)
+        response = self._request(
+            'POST', url, data=orjson.dumps({"file_id": file_id}), headers=_JSON_HEADERS, timeout=10
+        )
         response.raise_for_status()
-        return response.json()['result']
+        return orjson.loads(response.content)['result']
 
     def download_file(self, file_path: str, dest_path: Path) -> None:
         """Download file from Telegram servers.
@@ -173,21 +480,71 @@ class TelegramAPI:
             requests.RequestException: On download error
         """
         url = f"https://api.telegram.org/file/bot{self.bot_token}/{file_path}"
-        response = self.session.get(url, stream=True, timeout=60)
+        response = self._request('GET', url, stream=True, timeout=60)
         response.raise_for_status()
 
         dest_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(dest_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
+        try:
+            with open(dest_path, 'wb') as f:
+                # iter_content re-raises mid-body read errors as requests
+                # exceptions (and decodes Content-Encoding)
+                for chunk in response.iter_content(self.DOWNLOAD_CHUNK_SIZE):
                     f.write(chunk)
+        finally:
+            response.close()
+
+    def set_webhook(self, url: str, secret_token: str = "") -> dict:
+        """Register a webhook so Telegram pushes updates instead of being polled.
+
+        Args:
+            url: Public HTTPS URL of the webhook endpoint
+            secret_token: Value Telegram sends back in the
+                X-Telegram-Bot-Api-Secret-Token header
+
+        Returns:
+            API response dict
+
+        Raises:
+            requests.RequestException: On API error
+        """
+        payload = {"url": url, "allowed_updates": self.ALLOWED_UPDATES}
+        if secret_token:
+            payload["secret_token"] = secret_token
+        response = self._request(
+            'POST', f"{self.base_url}/setWebhook", data=orjson.dumps(payload), headers=_JSON_HEADERS, timeout=10
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    def delete_webhook(self) -> dict:
+        """Remove the registered webhook so getUpdates can be used again.
+
+        Pending updates are kept and delivered to the next getUpdates call.
+
+        Returns:
+            API response dict
+
+        Raises:
+            requests.RequestException: On API error
+        """
+        response = self._request('POST', f"{self.base_url}/deleteWebhook", timeout=10)
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
-    def get_updates(self, offset: Optional[int] = None, timeout: int = 30) -> list:
+    def get_updates(
+        self,
+        offset: Optional[int] = None,
+        timeout: int = 30,
+        limit: Optional[int] = None,
+        allowed_updates: Optional[list] = None
+    ) -> list:
         """Get updates (polling mode).
 
         Args:
             offset: Update offset
             timeout: Long polling timeout
+            limit: Maximum updates per call (default: UPDATES_LIMIT)
+            allowed_updates: Update types to receive (default: ALLOWED_UPDATES)
 
         Returns:
             List of updates
@@ -196,58 +553,65 @@ class TelegramAPI:
             requests.RequestException: On API error
         """
         url = f"{self.base_url}/getUpdates"
-        params = {"timeout": timeout}
+        params = {
+            "timeout": timeout,
+            "limit": limit or self.UPDATES_LIMIT,
+            # Query parameters carry the list as a JSON array
+            "allowed_updates": orjson.dumps(allowed_updates or self.ALLOWED_UPDATES).decode(),
+        }
         if offset is not None:
             params["offset"] = offset
 
-        response = self.session.get(url, params=params, timeout=timeout + 5)
+        # Short connect timeout so an unreachable API fails fast; the read
+        # timeout covers the long poll itself
+        response = self._request(
+            'GET', url, params=params, timeout=(self.CONNECT_TIMEOUT, timeout + 5)
+        )
         response.raise_for_status()
-        return response.json().get('result', [])
+        return orjson.loads(response.content).get('result', [])
 
     def send_document(self, chat_id: str, file_path, caption: str = "", filename: str = None) -> bool:
         """Send document file to Telegram chat.
 
         Args:
             chat_id: Telegram chat ID
-            file_path: Path to document file
+            file_path: Path to document file, or a binary file object
+                (e.g. io.BytesIO) holding the document
             caption: Optional caption
-            filename: Optional custom filename
+            filename: Optional custom filename (required for file objects
+                without a name)
 
         Returns:
             True if sent successfully, False otherwise
         """
         try:
-            file_path = Path(file_path)
-
-            if not file_path.exists():
-                print(f"[ERROR] File not found: {file_path}")
-                return False
+            if not hasattr(file_path, 'read'):
+                file_path = Path(file_path)
 
-            # Determine filename
-            if not filename:
-                filename = file_path.name
+                if not file_path.exists():
+                    print(f"[ERROR] File not found: {file_path}")
+                    return False
 
             # Send document
-            with open(file_path, 'rb') as f:
-                files = {'document': (filename, f)}
-                data = {'chat_id': chat_id}
-
-                if caption:
-                    data['caption'] = caption
-
-                response = self.session.post(
-                    f"{self.base_url}/sendDocument",
-                    data=data,
-                    files=files,
-                    timeout=60
-                )
-
-                if response.status_code != 200:
-                    print(f"[ERROR] Telegram sendDocument failed: {response.text}")
-                    return False
+            data = {'chat_id': chat_id}
+            if caption:
+                data['caption'] = caption
+
+            response = self._post_file(
+                f"{self.base_url}/sendDocument",
+                'document',
+                file_path,
+                data,
+                timeout=60,
+                filename=filename
+            )
+
+            if response.status_code != 200:
+                print(f"[ERROR] Telegram sendDocument failed: {response.text}")
+                return False
 
-                result = response.json()
-                return result.get('ok', False)
+            result = orjson.loads(response.content)
+            return result.get('ok', False)
 
         except Exception as e:
             print(f"[ERROR] Failed to send document: {e}")
@@ -264,32 +628,26 @@ class TelegramAPI:
         """
         try:
             # Get file path
-            response = self.session.get(
-                f"{self.base_url}/getFile",
-                params={'file_id': file_id},
-                timeout=10
-            )
-
-            if response.status_code != 200:
-                print(f"[ERROR] getFile failed: {response.text}")
+            try:
+                file_path = self.get_file(file_id)['file_path']
+            except requests.RequestException as e:
+                print(f"[ERROR] getFile failed: {e}")
                 return None
 
-            result = response.json()
-            if not result.get('ok'):
-                return None
-
-            file_path = result['result']['file_path']
-
             # Download file
             file_url = f"https://api.telegram.org/file/bot{self.bot_token}/{file_path}"
-            download_response = self.session.get(file_url, timeout=30)
+            with self._request('GET', file_url, stream=True, timeout=30) as download_response:
+                if download_response.status_code != 200:
+                    print(f"[ERROR] File download failed: {download_response.status_code}")
+                    return None
 
-            if download_response.status_code != 200:
-                print(f"[ERROR] File download failed: {download_response.status_code}")
-                return None
+                # Large blocks; iter_content keeps requests' error wrapping
+                buf = io.BytesIO()
+                for chunk in download_response.iter_content(self.DOWNLOAD_CHUNK_SIZE):
+                    buf.write(chunk)
 
             # Return as text (decode UTF-8)
-            return download_response.content.decode('utf-8', errors='ignore')
+            return buf.getvalue().decode('utf-8', errors='ignore')
 
         except Exception as e:
             print(f"[ERROR] Failed to download file: {e}")
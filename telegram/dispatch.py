@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""Command routing shared by the Telegram poller and webhook."""
+
+import re
+from typing import Tuple
+
+# Bot commands are "/" plus letters, digits and underscores, optionally
+# followed by "@botname" (added by Telegram clients in group chats); the
+# arguments are everything after it, which may span lines
+_COMMAND_RE = re.compile(r'(/\w+)(?:@\w+)?\s*(.*?)\s*\Z', re.DOTALL)
+
+
+def parse_command(text: str) -> Tuple[str, str]:
+    """Split a message into its command word and arguments.
+
+    The command ends at the first character that can't be part of one
+    (space, newline, "@botname", or inline content such as "/docx<p>").
+
+    Args:
+        text: Message text or caption
+
+    Returns:
+        (command, args) with args stripped, e.g. ('/song', 'desc\\n---\\nlyrics');
+        ('', '') if the text is not a command
+    """
+    match = _COMMAND_RE.match(text)
+    return match.groups() if match else ('', '')
@@ -4,17 +4,105 @@ Telegram handler for Docket HTML-to-DOCX conversions
 Add this file to your dashboard's telegram/ directory as docket_handler.py
 
 Usage in poller.py:
-    from telegram.docket_handler import handle_docx_command
+    from telegram.docket_handler import DOCX_COMMANDS, handle_docx_command
 
     # In message handler:
-    if text.startswith('/docx') or text.startswith('/convert'):
+    if text.startswith(DOCX_COMMANDS):
         handle_docx_command(telegram_api, message, DOCKET_URL)
 """
 
+import io
+import orjson
+import re
 import requests
-import tempfile
-from pathlib import Path
-from typing import Optional
+import urllib3
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Union
+
+
+# Shared session so conversions reuse pooled keep-alive connections to
+# Docket; only connection failures are retried (POST is not idempotent)
+_DOCKET_SESSION = requests.Session()
+_docket_adapter = HTTPAdapter(
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+)
+_DOCKET_SESSION.mount('http://', _docket_adapter)
+_DOCKET_SESSION.mount('https://', _docket_adapter)
+
+# Command prefixes routed to handle_docx_command (for str.startswith)
+DOCX_COMMANDS = ('/docx', '/convert')
+
+# Theme IDs Docket accepts
+DOCX_THEMES = frozenset({
+    'modern', 'corporate', 'minimal', 'horizon',
+    'obsidian', 'enterprise', 'clarity', 'emerald'
+})
+
+# "/docx [theme] [html]": the command (possibly /docx@botname), an optional
+# theme as its own word, and the rest verbatim as HTML (which may follow the
+# command directly, as in "/docx<p>...")
+_DOCX_RE = re.compile(
+    r'^/\w+(?:@\w+)?(?:\s+(?P<theme>' + '|'.join(sorted(DOCX_THEMES)) + r')(?!\S))?(?:\s*(?P<html>\S.*))?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Largest HTML accepted for conversion (bytes, UTF-8)
+MAX_HTML_SIZE = 2 * 1024 * 1024
+
+# Copy buffer for reading converted documents from Docket
+DOCKET_CHUNK_SIZE = 256 * 1024
+
+# Sends the "Converting..." message while the Docket request is in flight
+_status_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="docket-status")
+
+
+def _is_timeout(error: requests.exceptions.RequestException) -> bool:
+    """Check whether a requests error was a timeout.
+
+    A read timeout while streaming the body surfaces from iter_content as a
+    ConnectionError wrapping urllib3's ReadTimeoutError, not as Timeout.
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return True
+    return bool(error.args) and isinstance(error.args[0], urllib3.exceptions.ReadTimeoutError)
+
+
+def _status_result(status_msg: Union[Future, dict, None]) -> Optional[dict]:
+    """Wait for a status message send started in the background."""
+    if isinstance(status_msg, Future):
+        try:
+            return status_msg.result()
+        except Exception as e:
+            print(f"[WARN] Could not send status message: {e}")
+            return None
+    return status_msg
+
+
+def _update_status(telegram_api, chat_id, status_msg: Union[Future, dict, None], text: str):
+    """Show a follow-up in the "Converting..." message, or send it if there is none.
+
+    Editing the status message in place replaces a second sendMessage and
+    keeps one message per conversion in the chat.
+
+    Args:
+        telegram_api: TelegramAPI instance
+        chat_id: Chat ID
+        status_msg: sendMessage response (or its Future) for the status
+            message, or None
+        text: New status text
+    """
+    status_msg = _status_result(status_msg)
+    message_id = ((status_msg or {}).get('result') or {}).get('message_id')
+    if message_id is not None:
+        try:
+            telegram_api.edit_message_text(chat_id, message_id, text)
+            return
+        except Exception as e:
+            print(f"[WARN] Could not edit status message: {e}")
+    telegram_api.send_message(chat_id, text)
 
 
 def handle_docx_command(telegram_api, message: dict, docket_url: str):
@@ -33,13 +121,11 @@ def handle_docx_command(telegram_api, message: dict, docket_url: str):
         docket_url: Docket API URL (e.g., http://127.0.0.1:3050)
     """
     chat_id = message['chat']['id']
-    text = message.get('text', '')
+    # The command is the caption when it comes with an HTML file
+    text = message.get('text') or message.get('caption', '')
+    status_msg = None
 
     try:
-        # Parse command
-        parts = text.split(None, 2)  # ['/docx', 'theme?', 'html?']
-        command = parts[0] if parts else ''
-
         # Default options
         theme_id = 'modern'
         html_content = None
@@ -52,6 +138,13 @@ def handle_docx_command(telegram_api, message: dict, docket_url: str):
 
             # Only accept text/html or text/plain
             if mime_type in ['text/html', 'text/plain', 'application/octet-stream']:
+                # Reject oversized files before downloading them
+                if document.get('file_size', 0) > MAX_HTML_SIZE:
+                    telegram_api.send_message(
+                        chat_id, f"❌ HTML too large (max {MAX_HTML_SIZE // (1024 * 1024)}MB)"
+                    )
+                    return
+
                 file_id = document['file_id']
                 html_content = telegram_api.download_file_content(file_id)
 
@@ -66,21 +159,15 @@ def handle_docx_command(telegram_api, message: dict, docket_url: str):
                 )
                 return
 
-        # Parse inline HTML or options
-        if len(parts) >= 2:
-            # Check if second part is a theme name
-            available_themes = [
-                'modern', 'corporate', 'minimal', 'horizon',
-                'obsidian', 'enterprise', 'clarity', 'emerald'
-            ]
-
-            if parts[1].lower() in available_themes:
-                theme_id = parts[1].lower()
-                if len(parts) >= 3:
-                    html_content = parts[2]
-            else:
-                # Second part is HTML content
-                html_content = ' '.join(parts[1:])
+        # Parse inline HTML or options: /docx [theme] [html]. With an
+        # attached file the caption only picks the theme; any other caption
+        # text is not HTML
+        match = _DOCX_RE.match(text)
+        if match:
+            if match.group('theme'):
+                theme_id = match.group('theme').lower()
+            if match.group('html') and html_content is None:
+                html_content = match.group('html')
 
         # Validate we have HTML
         if not html_content:
@@ -94,8 +181,16 @@ def handle_docx_command(telegram_api, message: dict, docket_url: str):
             )
             return
 
-        # Send processing message
-        status_msg = telegram_api.send_message(
+        if len(html_content.encode('utf-8')) > MAX_HTML_SIZE:
+            telegram_api.send_message(
+                chat_id, f"❌ HTML too large (max {MAX_HTML_SIZE // (1024 * 1024)}MB)"
+            )
+            return
+
+        # Send processing message in the background; its round trip overlaps
+        # the conversion instead of delaying it
+        status_msg = _status_executor.submit(
+            telegram_api.send_message,
             chat_id,
             f"🔄 Converting to DOCX...\n"
             f"Theme: {theme_id}\n"
@@ -104,73 +199,75 @@ def handle_docx_command(telegram_api, message: dict, docket_url: str):
 
         # Call Docket API
         try:
-            response = requests.post(
+            with _DOCKET_SESSION.post(
                 f"{docket_url}/api/convert",
-                json={
+                data=orjson.dumps({
                     "html": html_content,
                     "format": format_type,
                     "themeId": theme_id
-                },
+                }),
                 headers={"Content-Type": "application/json"},
+                stream=True,
                 timeout=60  # 60 second timeout for conversion
-            )
-
-            if response.status_code != 200:
-                error_text = response.text[:200]
-                telegram_api.send_message(
-                    chat_id,
-                    f"❌ Conversion failed (HTTP {response.status_code})\n\n{error_text}"
-                )
-                return
+            ) as response:
+                if response.status_code != 200:
+                    error_text = response.text[:200]
+                    _update_status(
+                        telegram_api, chat_id, status_msg,
+                        f"❌ Conversion failed (HTTP {response.status_code})\n\n{error_text}"
+                    )
+                    return
 
-            # Save DOCX to temp file
-            with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as tmp:
-                tmp.write(response.content)
-                tmp_path = Path(tmp.name)
+                # Stream DOCX into memory; it goes straight back out as the
+                # upload body, so a temp file would only add a write and a read
+                docx = io.BytesIO()
+                for chunk in response.iter_content(DOCKET_CHUNK_SIZE):
+                    docx.write(chunk)
+                docx_size = docx.tell()
 
             # Send DOCX file
             caption = (
                 f"✅ Document ready!\n\n"
                 f"Theme: {theme_id}\n"
                 f"Format: {format_type.upper()}\n"
-                f"Size: {len(response.content) // 1024} KB"
+                f"Size: {docx_size // 1024} KB"
             )
 
+            # Keep the status message ahead of the document in the chat
+            status_msg = _status_result(status_msg)
+
             success = telegram_api.send_document(
                 chat_id,
-                tmp_path,
+                docx,
                 caption=caption,
                 filename=f"document_{theme_id}.{format_type}"
             )
 
-            # Clean up
-            tmp_path.unlink()
-
             if not success:
-                telegram_api.send_message(chat_id, "✅ Conversion complete but failed to send file")
+                _update_status(telegram_api, chat_id, status_msg, "✅ Conversion complete but failed to send file")
 
-        except requests.exceptions.Timeout:
-            telegram_api.send_message(
-                chat_id,
-                "❌ Conversion timed out (>60s)\n\nTry with smaller HTML or simpler content"
-            )
         except requests.exceptions.RequestException as e:
-            telegram_api.send_message(
-                chat_id,
-                f"❌ Failed to reach Docket service\n\nError: {str(e)[:100]}"
-            )
+            if _is_timeout(e):
+                _update_status(
+                    telegram_api, chat_id, status_msg,
+                    "❌ Conversion timed out (>60s)\n\nTry with smaller HTML or simpler content"
+                )
+            else:
+                _update_status(
+                    telegram_api, chat_id, status_msg,
+                    f"❌ Failed to reach Docket service\n\nError: {str(e)[:100]}"
+                )
 
     except Exception as e:
-        telegram_api.send_message(
-            chat_id,
+        _update_status(
+            telegram_api, chat_id, status_msg,
             f"❌ Error processing command\n\n{str(e)[:200]}"
         )
         print(f"[ERROR] Docket Telegram handler: {e}")
 
 
-def get_help_text() -> str:
-    """Get help text for Docket commands."""
-    return """
+# Help text for the Docket commands (appended to /help)
+HELP_TEXT = """
 📄 *Docket HTML→DOCX Converter*
 
 Convert HTML to professional Word documents with themes!
@@ -204,11 +301,16 @@ Or attach HTML file with `/docx` caption.
 """
 
 
+def get_help_text() -> str:
+    """Get help text for Docket commands."""
+    return HELP_TEXT
+
+
 # Integration code for poller.py
 INTEGRATION_SNIPPET = """
 # Add to telegram/poller.py message handler:
 
-from telegram.docket_handler import handle_docx_command, get_help_text
+from telegram.docket_handler import DOCX_COMMANDS, handle_docx_command, get_help_text
 
 # In _handle_message() method, add:
 
@@ -219,7 +321,7 @@ def _handle_message(self, message: dict):
     # ... existing command handlers ...
 
     # Docket HTML→DOCX conversion
-    if text.startswith('/docx') or text.startswith('/convert'):
+    if text.startswith(DOCX_COMMANDS):
         handle_docx_command(self.telegram_api, message, DOCKET_URL)
         return
 
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""Telegram bot command handlers, shared by the poller and the webhook."""
+
+import os
+import requests
+import shutil
+import threading
+import urllib3
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from .api import TelegramAPI, escape_markdown
+from .docket_handler import DOCX_COMMANDS, handle_docx_command
+from jobs.models import Job, JobStatus
+from ollama_helper import OllamaHelper
+
+# Docket URL for HTML→DOCX conversion
+DOCKET_PORT = os.environ.get("DOCKET_PORT", "3050")
+DOCKET_URL = f"http://127.0.0.1:{DOCKET_PORT}"
+
+# Largest photo /im2vid accepts (the Bot API's getFile download limit)
+MAX_PHOTO_SIZE = 20 * 1024 * 1024
+
+# Number of /songai generations run at once
+OLLAMA_WORKERS = 2
+
+# Ollama generations run here: the update handler hands /songai off and
+# returns, and the reply is sent from the generation's done callback
+_ollama_executor = ThreadPoolExecutor(max_workers=OLLAMA_WORKERS, thread_name_prefix="tg-ollama")
+
+# Free Ollama workers; /songai is refused rather than queued when none is
+_ollama_slots = threading.BoundedSemaphore(OLLAMA_WORKERS)
+
+# Total time a /songai generation may take, in seconds
+SONGAI_TIMEOUT = 120
+
+
+@dataclass(slots=True)
+class HandlerCtx:
+    """Dependencies of the command handlers."""
+    api: TelegramAPI
+    # Enqueues a job (returns False if the queue is full); must be thread-safe
+    enqueue: Callable[[Job], bool]
+    storage_root: Path
+    ollama: OllamaHelper
+
+
+def handle_docx(ctx: HandlerCtx, message: dict, chat_id: str, args: str) -> None:
+    """Handle /docx and /convert commands (Docket integration)."""
+    handle_docx_command(ctx.api, message, DOCKET_URL)
+
+
+def handle_help(ctx: HandlerCtx, message: dict, chat_id: str, args: str) -> None:
+    """Handle /help command."""
+    try:
+        ctx.api.send_message(chat_id, HELP_TEXT)
+    except Exception as e:
+        print(f"[Telegram] Failed to send help: {e}", flush=True)
+
+
+def handle_im2vid(ctx: HandlerCtx, message: dict, chat_id: str, args: str) -> None:
+    """Handle /im2vid command.
+
+    Args:
+        ctx: Handler dependencies
+        message: Telegram message dict
+        chat_id: Chat ID
+        args: Text after the command word
+    """
+    # Check for image
+    photo = message.get('photo')
+    if not photo:
+        try:
+            ctx.api.send_message(
+                chat_id,
+                "⚠️ Please attach an image with the `/im2vid` command."
+            )
+        except Exception:
+            pass
+        return
+
+    # Format: /im2vid <prompt>
+    prompt = args
+    if not prompt:
+        try:
+            ctx.api.send_message(
+                chat_id,
+                "⚠️ Usage: `/im2vid <your prompt>`\n\nExample: `/im2vid slow camera orbit, cinematic lighting`"
+            )
+        except Exception:
+            pass
+        return
+
+    # Get largest photo: the Bot API sends the PhotoSize array sorted by
+    # resolution, smallest first (core.telegram.org/bots/api#photosize)
+    largest_photo = photo[-1]
+    if largest_photo.get('file_size', 0) > MAX_PHOTO_SIZE:
+        try:
+            ctx.api.send_message(
+                chat_id,
+                f"⚠️ Image too large (max {MAX_PHOTO_SIZE // (1024 * 1024)} MB)."
+            )
+        except Exception:
+            pass
+        return
+
+    job_id = Job.new_id()
+
+    # Download image to job input dir
+    try:
+        file_info = ctx.api.get_file(largest_photo['file_id'])
+        file_path_tg = file_info['file_path']
+
+        input_dir = ctx.storage_root / job_id / "input"
+        input_dir.mkdir(parents=True, exist_ok=True)
+        # Streamed straight to disk by download_file (no in-memory copy)
+        ctx.api.download_file(file_path_tg, input_dir / "input.png")
+    except (requests.RequestException, urllib3.exceptions.HTTPError, ValueError, OSError, KeyError) as e:
+        print(f"[Telegram] Error downloading /im2vid image: {e}", flush=True)
+        # Nothing references the job yet; don't leave its directory behind
+        shutil.rmtree(ctx.storage_root / job_id, ignore_errors=True)
+        try:
+            ctx.api.send_message(
+                chat_id,
+                f"❌ Failed to queue job: {escape_markdown(str(e))}"
+            )
+        except Exception:
+            pass
+        return
+
+    # Create and enqueue the job before replying, so the worker doesn't wait
+    # on the notification round-trip
+    now = Job.now()
+    job = Job(
+        id=job_id,
+        status=JobStatus.QUEUED,
+        created_at=now,
+        updated_at=now,
+        prompt=prompt,
+        input_image_url=f"telegram://{file_path_tg}",  # Special marker
+        telegram_chat_id=chat_id,
+        params={
+            "seed": 1,
+            "resolution": "1280x720",
+            "fps": 16,
+            "duration_seconds": 5
+        }
+    )
+    queued = ctx.enqueue(job)
+    if queued:
+        print(f"[Telegram] Job {job_id} created from Telegram", flush=True)
+
+    # Notify user (best effort: the job is queued either way)
+    try:
+        if queued:
+            ctx.api.send_message(
+                chat_id,
+                f"✅ Job queued: `{job_id}`\n\n"
+                f"Prompt: {escape_markdown(prompt)}\n\n"
+                f"Your video will be sent here when ready (est. 2-4 minutes)!"
+            )
+        else:
+            ctx.api.send_message(
+                chat_id,
+                "⏳ The job queue is full right now. Please try again in a few minutes."
+            )
+    except (requests.RequestException, ValueError) as e:
+        print(f"[Telegram] Failed to notify chat {chat_id} about /im2vid: {e}", flush=True)
+
+
+def handle_song(ctx: HandlerCtx, message: dict, chat_id: str, args: str) -> None:
+    """Handle /song command.
+
+    Format:
+        /song
+        <description>
+        ---
+        <lyrics>
+
+    Args:
+        ctx: Handler dependencies
+        message: Telegram message dict
+        chat_id: Chat ID
+        args: Text after the command word
+    """
+    # Parse message - should have format /song\n<description>\n---\n<lyrics>
+    # (one scan: the split also tells whether the separator is there)
+    parts = args.split('---', 1)
+    if len(parts) != 2:
+        try:
+            ctx.api.send_message(
+                chat_id,
+                "⚠️ Usage: `/song`\n"
+                "`<description>`\n"
+                "`---`\n"
+                "`<lyrics>`\n\n"
+                "Example:\n"
+                "`/song`\n"
+                "`pop-punk, upbeat, fun, loud drums`\n"
+                "`---`\n"
+                "`This is the first line`\n"
+                "`Second line here`\n"
+                "`Then came the chorus`\n"
+                "`And we all laughed`"
+            )
+        except Exception:
+            pass
+        return
+
+    # The command word is already stripped off, so the first part is just
+    # the description
+    description, lyrics = (part.strip() for part in parts)
+
+    if not description or not lyrics:
+        try:
+            ctx.api.send_message(
+                chat_id,
+                "⚠️ Both description and lyrics are required!"
+            )
+        except Exception:
+            pass
+        return
+
+    # Create job
+    try:
+        job_id = Job.new_id()
+        now = Job.now()
+        job = Job(
+            id=job_id,
+            status=JobStatus.QUEUED,
+            created_at=now,
+            updated_at=now,
+            prompt=f"Song: {description[:50]}...",  # Short summary for display
+            telegram_chat_id=chat_id,
+            params={
+                "workflow_type": "song",
+                "song_description": description,
+                "song_lyrics": lyrics,
+            }
+        )
+
+        # Enqueue job
+        if not ctx.enqueue(job):
+            ctx.api.send_message(
+                chat_id,
+                "⏳ The job queue is full right now. Please try again in a few minutes."
+            )
+            return
+
+        # Notify user
+        ctx.api.send_message(
+            chat_id,
+            f"✅ Song queued: `{job_id}`\n\n"
+            f"Description: {escape_markdown(description[:100])}\n\n"
+            f"Your song will be sent here when ready (est. 2-3 minutes)!"
+        )
+
+        print(f"[Telegram] Song job {job_id} created from Telegram", flush=True)
+
+    except Exception as e:
+        print(f"[Telegram] Error handling /song: {e}", flush=True)
+        try:
+            ctx.api.send_message(
+                chat_id,
+                f"❌ Failed to queue job: {escape_markdown(str(e))}"
+            )
+        except Exception:
+            pass
+
+
+def handle_songai(ctx: HandlerCtx, message: dict, chat_id: str, args: str) -> None:
+    """Handle /songai command - AI-generated song.
+
+    Format: /songai <creative prompt>
+
+    Args:
+        ctx: Handler dependencies
+        message: Telegram message dict
+        chat_id: Chat ID
+        args: Text after the command word
+    """
+    user_prompt = args
+    if not user_prompt:
+        try:
+            ctx.api.send_message(
+                chat_id,
+                "⚠️ Usage: `/songai <your creative prompt>`\n\n"
+                "Example: `/songai upbeat song about a robot learning to dance`\n\n"
+                "The AI will generate both the description and lyrics for you!"
+            )
+        except Exception:
+            pass
+        return
+
+    if not _ollama_slots.acquire(blocking=False):
+        try:
+            ctx.api.send_message(
+                chat_id,
+                "🚦 The AI is busy with other songs right now. "
+                "Try again in a minute, or use `/song`."
+            )
+        except Exception:
+            pass
+        return
+
+    try:
+        # Send thinking message
+        ctx.api.send_message(
+            chat_id,
+            "🤖 Generating song with AI...\n\nThis may take 30-60 seconds."
+        )
+
+        # Generate song with Ollama; the reply is sent when it finishes
+        future = _ollama_executor.submit(
+            ctx.ollama.generate_song, user_prompt, deadline=SONGAI_TIMEOUT
+        )
+    except Exception as e:
+        _ollama_slots.release()
+        print(f"[Telegram] Error handling /songai: {e}", flush=True)
+        try:
+            ctx.api.send_message(
+                chat_id,
+                f"❌ Failed to generate AI song: {escape_markdown(str(e))}"
+            )
+        except Exception:
+            pass
+        return
+
+    future.add_done_callback(lambda f: _finish_songai(ctx, chat_id, user_prompt, f))
+
+
+def _finish_songai(ctx: HandlerCtx, chat_id: str, user_prompt: str, future: Future) -> None:
+    """Queue the song job for a finished /songai generation and reply.
+
+    Runs on the Ollama worker (as the generation's done callback) and frees
+    its slot when done.
+
+    Args:
+        ctx: Handler dependencies
+        chat_id: Chat ID
+        user_prompt: User's creative prompt
+        future: Finished generate_song() call
+    """
+    try:
+        try:
+            result = future.result()
+        except TimeoutError:
+            print(f"[Telegram] /songai timed out after {SONGAI_TIMEOUT}s", flush=True)
+            ctx.api.send_message(
+                chat_id,
+                "⌛ AI timed out, try `/song` manually."
+            )
+            return
+
+        if not result:
+            ctx.api.send_message(
+                chat_id,
+                "❌ Failed to generate song. Make sure Ollama is running with qwen2.5:7b model."
+            )
+            return
+
+        description, lyrics = result
+
+        # Create job
+        job_id = Job.new_id()
+        now = Job.now()
+        job = Job(
+            id=job_id,
+            status=JobStatus.QUEUED,
+            created_at=now,
+            updated_at=now,
+            prompt=f"AI Song: {user_prompt[:50]}...",
+            telegram_chat_id=chat_id,
+            params={
+                "workflow_type": "song",
+                "song_description": description,
+                "song_lyrics": lyrics,
+            }
+        )
+
+        # Enqueue job
+        if not ctx.enqueue(job):
+            ctx.api.send_message(
+                chat_id,
+                "⏳ The job queue is full right now. Please try again in a few minutes."
+            )
+            return
+
+        # Notify user
+        ctx.api.send_message(
+            chat_id,
+            f"✅ AI-generated song queued: `{job_id}`\n\n"
+            f"**Description:** {escape_markdown(description[:100])}\n\n"
+            f"**Lyrics preview:**\n{escape_markdown(lyrics[:200])}...\n\n"
+            f"Your song will be sent here when ready (est. 2-3 minutes)!"
+        )
+
+        print(f"[Telegram] AI song job {job_id} created from Telegram", flush=True)
+
+    except Exception as e:
+        print(f"[Telegram] Error handling /songai: {e}", flush=True)
+        try:
+            ctx.api.send_message(
+                chat_id,
+                f"❌ Failed to generate AI song: {escape_markdown(str(e))}"
+            )
+        except Exception:
+            pass
+
+    finally:
+        _ollama_slots.release()
+
+
+# Reply to /help (built once at import)
+HELP_TEXT = """🎥🎵📄 **Media Generation & Conversion Bot**
+
+**Commands:**
+
+`/im2vid <prompt>` - Generate video from image
+  • Attach an image with the command
+  • Example: `/im2vid slow camera orbit, cinematic`
+
+`/song` - Generate a song (manual)
+  • Format:
+    ```
+    /song
+    description here
+    ---
+    lyrics here
+    ```
+  • Example:
+    ```
+    /song
+    pop-punk, upbeat, fun
+    ---
+    This is the first line
+    Second line here
+    Then came the chorus
+    And we all laughed
+    ```
+
+`/songai <prompt>` - Generate a song (AI-assisted)
+  • AI generates description & lyrics for you
+  • Example: `/songai upbeat song about a robot learning to dance`
+
+`/docx <html>` - Convert HTML to DOCX
+  • Send HTML inline or attach .html file
+  • Example: `/docx <h1>Title</h1><p>Content</p>`
+  • With theme: `/docx corporate <h1>Report</h1>`
+  • Available themes: modern, corporate, minimal, horizon, obsidian
+
+`/help` - Show this help message
+
+**How it works:**
+• **Video**: Send `/im2vid` with image, wait ~2-4 min
+• **Song**: Send `/song` with description and lyrics, wait ~2-3 min
+• **DOCX**: Send `/docx` with HTML, receive instantly
+
+**Tips:**
+• Describe motion: "person walks", "camera pans left"
+• Add atmosphere: "cinematic lighting", "dramatic"
+• Be specific: "person turns head and smiles"
+
+**Powered by ComfyUI & Docket**
+"""
+
+
+# Command word -> handler(ctx, message, chat_id, args)
+COMMANDS = {
+    **{command: handle_docx for command in DOCX_COMMANDS},
+    '/help': handle_help,
+    '/im2vid': handle_im2vid,
+    '/songai': handle_songai,
+    '/song': handle_song,
+}
@@ -1,202 +1,129 @@
 #!/usr/bin/env python3
 """Telegram webhook handler (Flask blueprint)."""
 
+import hmac
+import orjson
 from flask import Blueprint, request, jsonify
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Callable
 
 from .api import TelegramAPI
-from jobs.models import Job, JobStatus
+from .dispatch import parse_command
+from .handlers import COMMANDS, HandlerCtx
+from jobs.models import Job
+from ollama_helper import OllamaHelper
 
 telegram_bp = Blueprint('telegram', __name__)
 
 # Global state (set by app initialization)
 _telegram_api: Optional[TelegramAPI] = None
 _telegram_enabled_func: Optional[Callable[[], bool]] = None
-_enqueue_job_func: Optional[Callable[[Job], None]] = None
-_storage_root: Optional[Path] = None
+_ctx: Optional[HandlerCtx] = None
+_secret_token: str = ""
+
+# Header Telegram uses to echo the secret_token given to setWebhook
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Updates are handled off the request thread so Telegram gets its 200 at once
+# (slow handlers would otherwise hit its timeout and trigger redelivery)
+_update_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="telegram-webhook")
 
 
 def init_webhook(
     telegram_api: TelegramAPI,
     telegram_enabled_func: Callable[[], bool],
-    enqueue_job_func: Callable[[Job], None],
-    storage_root: Path
+    enqueue_job_func: Callable[[Job], bool],
+    storage_root: Path,
+    secret_token: str = ""
 ):
     """Initialize webhook with dependencies.
 
     Args:
         telegram_api: Telegram API client
         telegram_enabled_func: Function returning if Telegram is enabled
-        enqueue_job_func: Function to enqueue jobs
+        enqueue_job_func: Function to enqueue jobs (returns False if the queue is full)
         storage_root: Storage root path
+        secret_token: If set, updates must carry it in SECRET_TOKEN_HEADER
     """
-    global _telegram_api, _telegram_enabled_func, _enqueue_job_func, _storage_root
+    global _telegram_api, _telegram_enabled_func, _ctx, _secret_token
     _telegram_api = telegram_api
     _telegram_enabled_func = telegram_enabled_func
-    _enqueue_job_func = enqueue_job_func
-    _storage_root = storage_root
+    _ctx = HandlerCtx(
+        api=telegram_api,
+        enqueue=enqueue_job_func,
+        storage_root=Path(storage_root),
+        ollama=OllamaHelper()
+    )
+    _secret_token = secret_token
 
 
 @telegram_bp.route('/telegram/webhook', methods=['POST'])
 def webhook():
     """Handle Telegram webhook updates."""
-    if not _telegram_api or not _telegram_enabled_func or not _enqueue_job_func:
+    if not _telegram_api or not _telegram_enabled_func or not _ctx:
         return jsonify({"error": "Webhook not initialized"}), 500
 
-    update = request.get_json()
-    if not update:
-        return jsonify({"ok": True})
+    if _secret_token and not hmac.compare_digest(
+        request.headers.get(SECRET_TOKEN_HEADER, ''), _secret_token
+    ):
+        return jsonify({"error": "Invalid secret token"}), 403
 
-    # Extract message
-    message = update.get('message')
-    if not message:
-        return jsonify({"ok": True})
-
-    chat_id = str(message['chat']['id'])
-    text = message.get('text', '')
+    # Decode with orjson directly, whichever JSON provider the app uses
+    try:
+        update = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        update = None
+    if isinstance(update, dict) and update:
+        _update_executor.submit(_process_update, update)
 
-    # Check if Telegram is enabled
-    if not _telegram_enabled_func():
-        try:
-            _telegram_api.send_message(
-                chat_id,
-                "⚠️ Telegram bot is currently disabled by administrator."
-            )
-        except Exception:
-            pass
-        return jsonify({"ok": True})
+    return jsonify({"ok": True})
 
-    # Handle /help command
-    if text.startswith('/help'):
-        help_text = _get_help_text()
-        try:
-            _telegram_api.send_message(chat_id, help_text)
-        except Exception as e:
-            print(f"Failed to send help: {e}")
-        return jsonify({"ok": True})
 
-    # Handle /im2vid command
-    if text.startswith('/im2vid'):
-        return _handle_im2vid(message, chat_id, text)
+def _process_update(update: dict) -> None:
+    """Process one Telegram update (runs on the webhook executor).
 
-    return jsonify({"ok": True})
+    Args:
+        update: Telegram update dict
+    """
+    try:
+        _dispatch_update(update)
+    except Exception as e:
+        print(f"Error processing Telegram update: {e}")
 
 
-def _handle_im2vid(message: dict, chat_id: str, text: str) -> tuple:
-    """Handle /im2vid command.
+def _dispatch_update(update: dict) -> None:
+    """Route a Telegram update to its command handler.
 
     Args:
-        message: Telegram message dict
-        chat_id: Chat ID
-        text: Message text
-
-    Returns:
-        Flask response tuple
+        update: Telegram update dict
     """
-    # Check for image
-    photo = message.get('photo')
-    if not photo:
-        try:
-            _telegram_api.send_message(
-                chat_id,
-                "⚠️ Please attach an image with the `/im2vid` command."
-            )
-        except Exception:
-            pass
-        return jsonify({"ok": True}), 200
+    # Extract message
+    message = update.get('message')
+    if not message:
+        return
 
-    # Parse prompt from command
-    # Format: /im2vid <prompt>
-    parts = text.split(maxsplit=1)
-    if len(parts) < 2:
-        try:
-            _telegram_api.send_message(
-                chat_id,
-                "⚠️ Usage: `/im2vid <your prompt>`\n\nExample: `/im2vid slow camera orbit, cinematic lighting`"
-            )
-        except Exception:
-            pass
-        return jsonify({"ok": True}), 200
+    # Text can be in 'text' (text messages) or 'caption' (photo/video with caption)
+    text = message.get('text') or message.get('caption', '')
 
-    prompt = parts[1].strip()
+    # Ignore ordinary chat (e.g. group messages) before doing any work;
+    # routing is a single dict lookup on the command word
+    command, args = parse_command(text)
+    handler = COMMANDS.get(command)
+    if not handler:
+        return
 
-    # Download image
-    try:
-        # Get largest photo
-        largest_photo = max(photo, key=lambda p: p.get('file_size', 0))
-        file_info = _telegram_api.get_file(largest_photo['file_id'])
-        file_path_tg = file_info['file_path']
-
-        # Create job
-        job_id = str(uuid.uuid4())
-        job = Job(
-            id=job_id,
-            status=JobStatus.QUEUED,
-            created_at=Job.now(),
-            updated_at=Job.now(),
-            prompt=prompt,
-            input_image_url=f"telegram://{file_path_tg}",  # Special marker
-            telegram_chat_id=chat_id,
-            params={
-                "seed": 1,
-                "duration_seconds": 5,
-                "fps": 24,
-                "resolution": "768x768"
-            }
-        )
-
-        # Download image to job input dir
-        input_dir = _storage_root / job_id / "input"
-        input_dir.mkdir(parents=True, exist_ok=True)
-        image_path = input_dir / "input.png"
-
-        _telegram_api.download_file(file_path_tg, image_path)
-
-        # Enqueue job
-        _enqueue_job_func(job)
-
-        # Notify user
-        _telegram_api.send_message(
-            chat_id,
-            f"✅ Job queued: `{job_id}`\n\n"
-            f"Prompt: {prompt}\n\n"
-            f"Your video will be sent here when ready!"
-        )
+    chat_id = str(message['chat']['id'])
 
-    except Exception as e:
-        print(f"Error handling /im2vid: {e}")
+    # Check if Telegram is enabled
+    if not _telegram_enabled_func():
         try:
             _telegram_api.send_message(
                 chat_id,
-                f"❌ Failed to queue job: {str(e)}"
+                "⚠️ Telegram bot is currently disabled by administrator."
             )
         except Exception:
             pass
+        return
 
-    return jsonify({"ok": True}), 200
-
-
-def _get_help_text() -> str:
-    """Get help text for bot commands.
-
-    Returns:
-        Help text string
-    """
-    return """🎥 **Image to Video Bot**
-
-**Commands:**
-
-`/im2vid <prompt>` - Generate video from image
-  • Attach an image with the command
-  • Example: `/im2vid slow camera orbit, cinematic`
-
-`/help` - Show this help message
-
-**Setup:**
-For setup instructions, visit the admin dashboard or check the README-telegram.md file.
-
-**Support:**
-Contact your administrator for help.
-"""
+    handler(_ctx, message, chat_id, args)